@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import pickle
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from src.core import config
+from src.services.retrieval import HybridRetriever
+
+QUERIES = [
+    "Hiệp định Giơnevơ 1954",
+    "Chiến dịch Điện Biên Phủ",
+    "Phong trào Đồng khởi năm 1960",
+    "Chiến dịch Hồ Chí Minh 30/4/1975",
+]
+
+
+def memory_kb() -> dict:
+    """
+    RSS, PSS và USS (private) của tiến trình hiện tại theo /proc/self/smaps_rollup.
+    PSS chia đều các trang dùng chung cho các tiến trình cùng map.
+    """
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return {"rss": values["Rss"], "pss": values["Pss"],
+            "uss": values["Private_Clean"] + values["Private_Dirty"]}
+
+
+class _FixedQueryPipeline:
+    """Vector truy vấn cố định: đo phần index, không cần tải model embedding."""
+    def __init__(self, dim: int):
+        self.vector = np.random.default_rng(0).standard_normal(dim).astype(np.float32)
+
+    def embed_text(self, text: str, is_query: bool = False) -> np.ndarray:
+        return self.vector.copy()
+
+
+def worker(mode: str, queries: int, barrier, results):
+    before = memory_kb()
+    if mode == "mmap":
+        retriever = HybridRetriever.from_index_dir(config.SHARED_INDEX_DIR, _FixedQueryPipeline(768))
+    else:
+        with open(config.EMBEDDINGS_FILE_PATH, 'rb') as f:
+            embedded_chunks = pickle.load(f)
+        retriever = HybridRetriever(embedded_chunks, _FixedQueryPipeline(768))
+        del embedded_chunks
+    # Chạm toàn bộ dữ liệu một lần để mọi trang được nạp
+    retriever.retrieve_with_rerank(QUERIES[0], top_k=5)
+    _ = [retriever.store.content(i) for i in range(len(retriever.store))]
+
+    barrier.wait()
+    start = time.perf_counter()
+    for i in range(queries):
+        retriever.retrieve_with_rerank(QUERIES[i % len(QUERIES)], top_k=5)
+    elapsed = time.perf_counter() - start
+    barrier.wait()
+    # Đo sau khi mọi worker đã map xong để PSS phản ánh phần chia sẻ
+    after = memory_kb()
+    results.put({key: after[key] - before[key] for key in after} | {"qps": queries / elapsed})
+
+
+def run(mode: str, workers: int, queries: int) -> dict:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, queries, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return {
+        "mode": mode, "workers": workers,
+        "index_rss_mb": sum(r["rss"] for r in rows) / workers / 1024,
+        "index_pss_mb": sum(r["pss"] for r in rows) / workers / 1024,
+        "index_uss_mb": sum(r["uss"] for r in rows) / workers / 1024,
+        "total_qps": sum(r["qps"] for r in rows),
+    }
+
+
+def main():
+    """
+    So sánh bộ nhớ index mỗi worker và thông lượng truy xuất giữa chế độ
+    load pickle (mỗi worker một bản) và chế độ mmap index dùng chung.
+    Không gồm model embedding (mỗi worker vẫn tải model riêng).
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    from scripts.serve import ensure_shared_index
+    ensure_shared_index(config.SHARED_INDEX_DIR)
+
+    print(f"{'mode':<7}{'workers':>8}{'RSS/w MB':>10}{'PSS/w MB':>10}{'USS/w MB':>10}{'QPS':>10}")
+    for n in [int(x) for x in args.workers.split(",")]:
+        for mode in ("pickle", "mmap"):
+            r = run(mode, n, args.queries)
+            print(f"{r['mode']:<7}{r['workers']:>8}{r['index_rss_mb']:>10.1f}{r['index_pss_mb']:>10.1f}"
+                  f"{r['index_uss_mb']:>10.1f}{r['total_qps']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
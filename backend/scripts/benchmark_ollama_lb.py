@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from src.services.llm_client import LoadBalancedTransport, LLMUnavailableError
+
+
+def start_fake_ollama(latency: float, fail: bool = False, fail_health: Optional[bool] = None,
+                      fail_times: int = 0) -> ThreadingHTTPServer:
+    """
+    Khởi động một server giả lập Ollama trên cổng ngẫu nhiên: GET / trả về 200,
+    POST /api/generate ngủ `latency` giây rồi trả lời (hoặc trả 503 nếu `fail`).
+    `fail_health` mặc định theo `fail`; đặt False để có host qua được health
+    check nhưng POST vẫn lỗi. `fail_times`: chỉ `fail_times` POST đầu trả 503.
+    Các cờ là thuộc tính của server (`server.fail`, `server.fail_health`,
+    `server.latency`) nên đổi được khi đang chạy. Server đếm số POST nhận được
+    (`server.posts`) và số POST đồng thời lớn nhất (`server.max_active`).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(503 if self.server.fail_health else 200)
+            self.end_headers()
+            self.wfile.write(b"Ollama is running")
+
+        def do_POST(self):
+            server = self.server
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with server.stats_lock:
+                server.posts += 1
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+                fail_now = server.fail or server.posts <= server.fail_times
+            try:
+                time.sleep(server.latency)
+            finally:
+                with server.stats_lock:
+                    server.active -= 1
+            if fail_now:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            text = f"ok từ {server.server_port}"
+            if payload.get("stream"):
+                lines = [{"response": text, "done": False}, {"response": "", "done": True}]
+                body = b"".join(json.dumps(line).encode() + b"\n" for line in lines)
+            else:
+                body = json.dumps({"response": text, "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.latency = latency
+    server.fail = fail
+    server.fail_health = fail if fail_health is None else fail_health
+    server.fail_times = fail_times
+    server.posts = 0
+    server.active = 0
+    server.max_active = 0
+    server.stats_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    """
+    Chạy LoadBalancedTransport với các server Ollama giả có độ trễ khác nhau,
+    in số yêu cầu mỗi backend nhận được và phân vị độ trễ.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latencies", default="0.05,0.1,0.4", help="Độ trễ (giây) của từng backend")
+    parser.add_argument("--failing", type=int, default=1, help="Số backend luôn trả về 503")
+    parser.add_argument("--cap", type=int, default=4, help="Giới hạn đồng thời mỗi backend")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    servers = [start_fake_ollama(float(l)) for l in args.latencies.split(",")]
+    servers += [start_fake_ollama(0.01, fail=True) for _ in range(args.failing)]
+    urls = [f"http://127.0.0.1:{s.server_port}|{args.cap}" for s in servers]
+    transport = LoadBalancedTransport.from_urls(urls, probe_interval=1.0)
+    transport.probe()
+
+    counts = {}
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one_request(_):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            result = transport.post_json("/api/generate", {"prompt": "x"}, deadline=10)
+        except LLMUnavailableError:
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            counts[result["response"]] = counts.get(result["response"], 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one_request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{args.requests} yêu cầu trong {elapsed:.2f}s ({args.requests / elapsed:.1f} req/s), lỗi: {errors}")
+    for name, count in sorted(counts.items()):
+        print(f"  {name}: {count}")
+    if latencies:
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        print(f"  p50={p50:.1f} ms | p99={p99:.1f} ms")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
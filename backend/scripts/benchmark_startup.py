@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "tiktoken", "google.generativeai"]
+
+# Các module mỗi chế độ phải import (không tính tải trọng số model / dữ liệu)
+MODES = {
+    # Tiến trình cha của serve.py, script build index / benchmark
+    "index": ["src.services.retrieval", "src.services.index_store"],
+    # Worker SERVER_MODE=retrieval: cần model embedding cho câu hỏi, không cần Gemini SDK
+    "retrieval": ["fastapi", "src.services.retrieval", "src.services.generation", "sentence_transformers"],
+    # Worker đầy đủ
+    "full": ["fastapi", "src.services.retrieval", "src.services.generation", "sentence_transformers",
+             "google.generativeai"],
+}
+
+CHILD_CODE = """
+import importlib, json, resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(modules, env=None, repeat: int = 3) -> dict:
+    """
+    Đo trong tiến trình con mới (cache import của Python trống), lấy lần
+    nhanh nhất trong `repeat` lần để loại nhiễu đọc đĩa lần đầu.
+    """
+    runs = []
+    for _ in range(repeat):
+        code = CHILD_CODE.format(root=project_root, modules=modules, heavy=HEAVY_MODULES)
+        output = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True,
+                                env=env, cwd=project_root, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run["import_ms"])
+
+
+def main():
+    """
+    Đo thời gian import và RSS đỉnh cho từng chế độ chạy. Với --app, đo thêm
+    `import src.main` thật (cần model embedding và dữ liệu đã tiền xử lý).
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--app", action="store_true", help="Đo cả khởi động app (src.main) ở mỗi chế độ server")
+    args = parser.parse_args()
+
+    print(f"{'Chế độ':<16}{'Import (ms)':>12}{'RSS đỉnh (MB)':>15}  Thư viện nặng đã tải")
+    for mode, modules in MODES.items():
+        result = measure(modules, repeat=args.repeat)
+        print(f"{mode:<16}{result['import_ms']:>12.0f}{result['maxrss_mb']:>15.0f}  {', '.join(result['heavy']) or '-'}")
+
+    if args.app:
+        for mode in ("retrieval", "full"):
+            env = {**os.environ, "SERVER_MODE": mode}
+            result = measure(["src.main"], env=env, repeat=1)
+            print(f"{'app/' + mode:<16}{result['import_ms']:>12.0f}{result['maxrss_mb']:>15.0f}  {', '.join(result['heavy']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
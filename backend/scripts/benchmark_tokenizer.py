@@ -0,0 +1,120 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from src.core import config
+from src.services.retrieval import BM25
+
+
+def legacy_tokenize(text: str):
+    """Tokenizer cũ (3 lượt regex qua cache của module re), giữ lại để so sánh."""
+    text = text.lower()
+    text = re.sub(r'(\d{1,2}[-/]\d{1,2}[-/]\d{4})', r' \1 ', text)
+    text = re.sub(r'\b(\d+)\b', r' \1 ', text)
+    return re.findall(r'\w+', text, re.UNICODE)
+
+
+# Cụm >= 2 âm tiết viết hoa liên tiếp: tên riêng như "Điện Biên Phủ", "Hồ Chí Minh"
+_NAME_RE = re.compile(r'\b(?:[A-ZÀ-Ỹ][\wÀ-ỹ]*\s){1,3}[A-ZÀ-Ỹ][\wÀ-ỹ]*\b')
+
+
+def throughput(tokenize, corpus, repeats):
+    start = time.perf_counter()
+    tokens = 0
+    for _ in range(repeats):
+        for doc in corpus:
+            tokens += len(tokenize(doc))
+    elapsed = time.perf_counter() - start
+    return tokens / elapsed, len(corpus) * repeats / elapsed
+
+
+def index_size(bm25: BM25):
+    arrays, vocab, _ = bm25.to_arrays()
+    return len(vocab), len(bm25.postings_doc), sum(a.nbytes for a in arrays.values()) / 1e6
+
+
+def evaluate(bm25: BM25, queries, k=5):
+    """
+    Truy vấn known-item: MRR@10 của chunk nguồn.
+    Truy vấn tên riêng: tỉ lệ top-k có chứa nguyên cụm tên (precision@k).
+    """
+    rr = []
+    for query, target in queries["known_item"]:
+        top = np.argsort(-bm25.get_scores(query))[:10]
+        hits = np.where(top == target)[0]
+        rr.append(1.0 / (hits[0] + 1) if len(hits) else 0.0)
+    precision = []
+    for name, relevant in queries["names"]:
+        top = np.argsort(-bm25.get_scores(name))[:k]
+        precision.append(np.mean([idx in relevant for idx in top]))
+    return float(np.mean(rr)), float(np.mean(precision))
+
+
+def build_queries(corpus, n, seed):
+    rng = random.Random(seed)
+    lowered = [doc.lower() for doc in corpus]
+    known_item = []
+    for target in rng.sample(range(len(corpus)), min(n, len(corpus))):
+        words = corpus[target].split()
+        if len(words) < 8:
+            continue
+        start = rng.randrange(len(words) - 5)
+        known_item.append((" ".join(words[start:start + rng.randint(3, 5)]), target))
+
+    names = {}
+    for doc in corpus:
+        for match in _NAME_RE.findall(doc):
+            names[match] = names.get(match, 0) + 1
+    # Tên xuất hiện ở nhiều chunk nhưng không phải mọi chunk
+    candidates = sorted(name for name, count in names.items() if 3 <= count <= len(corpus) // 10)
+    name_queries = []
+    for name in rng.sample(candidates, min(n, len(candidates))):
+        relevant = {i for i, doc in enumerate(lowered) if name.lower() in doc}
+        name_queries.append((name, relevant))
+    return {"known_item": known_item, "names": name_queries}
+
+
+def main():
+    """
+    So sánh tokenizer cũ và mới (unigram, unigram + bigram âm tiết):
+    thông lượng tách từ, kích thước index BM25 và chất lượng truy xuất BM25.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(config.CHUNKS_JSON_PATH, 'r', encoding='utf-8') as f:
+        corpus = [chunk["content"] for chunk in json.load(f)]
+
+    legacy = BM25()
+    legacy._tokenize_vietnamese = legacy_tokenize
+    variants = {"legacy": legacy, "unigram": BM25(), "bigram": BM25(bigrams=True)}
+    for bm25 in variants.values():
+        bm25.fit(corpus)
+
+    queries = build_queries(corpus, args.queries, args.seed)
+    print(f"{len(corpus)} chunks | {len(queries['known_item'])} truy vấn known-item | "
+          f"{len(queries['names'])} truy vấn tên riêng")
+    print(f"{'tokenizer':<10}{'tokens/s':>12}{'docs/s':>10}{'vocab':>9}{'postings':>10}"
+          f"{'index MB':>10}{'MRR@10':>8}{'P@5 tên':>9}")
+    for name, bm25 in variants.items():
+        tokens_per_s, docs_per_s = throughput(bm25._tokenize_vietnamese, corpus, args.repeats)
+        vocab, postings, size_mb = index_size(bm25)
+        mrr, precision = evaluate(bm25, queries)
+        print(f"{name:<10}{tokens_per_s:>12,.0f}{docs_per_s:>10,.0f}{vocab:>9}{postings:>10}"
+              f"{size_mb:>10.2f}{mrr:>8.3f}{precision:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import requests
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from src.core import config
+from src.services.generation import ANSWER_SYSTEM_PROMPT, BaseRAGGenerator
+from src.services.chunk_store import ChunkStore, RetrievedChunk
+
+
+def measure_ollama_ttft(system_prompt: str, prompt: str, session: requests.Session) -> dict:
+    """
+    Gửi một yêu cầu stream tới Ollama, đo thời gian tới token đầu tiên (TTFT)
+    và lấy thời gian prompt eval từ gói cuối cùng.
+    """
+    payload = {
+        "model": config.OLLAMA_MODEL_NAME,
+        "system": system_prompt,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": config.OLLAMA_KEEP_ALIVE,
+        "options": {"temperature": 0.1, "num_ctx": 4096, "num_predict": 32}
+    }
+    start = time.perf_counter()
+    ttft = None
+    final = {}
+    with session.post(f"{config.OLLAMA_API_URL}/api/generate", json=payload, stream=True, timeout=120) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if ttft is None and data.get("response"):
+                ttft = time.perf_counter() - start
+            if data.get("done"):
+                final = data
+    return {
+        "ttft": ttft,
+        "prompt_eval_count": final.get("prompt_eval_count"),
+        "prompt_eval_ms": final.get("prompt_eval_duration", 0) / 1e6,
+    }
+
+
+def main():
+    """
+    Đo TTFT của Ollama trên các yêu cầu lặp lại có cùng tiền tố hệ thống.
+    Lần gọi đầu là cold, các lần sau phải tái sử dụng KV-cache của tiền tố.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--chunks", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(config.CHUNKS_JSON_PATH, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+    store = ChunkStore.from_columns(
+        range(len(chunks)), (c["content"] for c in chunks), (c["metadata"] for c in chunks)
+    )
+
+    generator = BaseRAGGenerator()
+    questions = [
+        "Hiệp định Giơnevơ được ký kết khi nào?",
+        "Chiến dịch Hồ Chí Minh diễn ra như thế nào?",
+        "Phong trào Đồng khởi có ý nghĩa gì?",
+    ]
+    session = requests.Session()
+
+    print(f"Ollama: {config.OLLAMA_API_URL} | model: {config.OLLAMA_MODEL_NAME} | keep_alive: {config.OLLAMA_KEEP_ALIVE}")
+    for i in range(args.repeats):
+        question = questions[i % len(questions)]
+        first = (i % len(questions)) * args.chunks
+        context_chunks = [RetrievedChunk(store, idx, rank, 0.0)
+                          for rank, idx in enumerate(range(first, first + args.chunks), 1)]
+        _, prompt = generator._create_prompt_parts(question, context_chunks)
+        result = measure_ollama_ttft(ANSWER_SYSTEM_PROMPT, prompt, session)
+        ttft_ms = result["ttft"] * 1000 if result["ttft"] is not None else float("nan")
+        print(f"#{i+1}: TTFT={ttft_ms:.1f} ms | prompt_eval={result['prompt_eval_count']} tokens "
+              f"trong {result['prompt_eval_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
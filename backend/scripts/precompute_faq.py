@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from src.core import config
+from src.services.faq import ANSWERS_FILE, context_fingerprint, read_answers, write_index
+from src.services.singleflight import normalize_query
+
+
+def load_questions(path: str) -> List[str]:
+    """
+    File FAQ: .json (danh sách chuỗi hoặc object có "question") hoặc văn bản
+    mỗi dòng một câu hỏi. Câu trùng nhau sau chuẩn hóa chỉ giữ câu đầu tiên.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            items = json.load(f)
+            questions = [item["question"] if isinstance(item, dict) else item for item in items]
+        else:
+            questions = [line.strip() for line in f]
+    seen = set()
+    unique = []
+    for question in questions:
+        key = normalize_query(question or "")
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(question.strip())
+    return unique
+
+
+def build_retriever():
+    # Import muộn: chỉ cần model embedding + retriever khi thực sự chạy job
+    from src.services.embedding import EmbeddingPipeline
+    from src.services.retrieval import HybridRetriever
+
+    embedding_pipeline = EmbeddingPipeline(model_name=config.EMBEDDING_MODEL_NAME)
+    if config.USE_SHARED_INDEX:
+        return HybridRetriever.from_index_dir(
+            config.SHARED_INDEX_DIR,
+            embedding_pipeline=embedding_pipeline,
+            semantic_weight=config.SEMANTIC_WEIGHT,
+            keyword_weight=config.KEYWORD_WEIGHT
+        )
+    return HybridRetriever(
+        embedded_chunks=embedding_pipeline.load_embeddings(config.EMBEDDINGS_FILE_PATH),
+        embedding_pipeline=embedding_pipeline,
+        semantic_weight=config.SEMANTIC_WEIGHT,
+        keyword_weight=config.KEYWORD_WEIGHT,
+        bm25_bigrams=config.BM25_BIGRAMS
+    )
+
+
+def build_generator(model: str):
+    from src.services.generation import GeminiRAGGenerator, QwenOllamaGenerator
+
+    if model == "gemini":
+        return GeminiRAGGenerator()
+    if model == "qwen":
+        return QwenOllamaGenerator()
+    raise ValueError(f"Model '{model}' không hợp lệ. Chỉ chấp nhận 'gemini' hoặc 'qwen'.")
+
+
+def main():
+    """
+    Sinh sẵn câu trả lời cho tập câu hỏi FAQ:
+    1. Truy xuất theo lô cho mọi câu hỏi.
+    2. Bỏ qua câu đã có câu trả lời với cùng bối cảnh (dấu vân tay chunk).
+    3. Sinh câu trả lời còn thiếu song song tối đa --concurrency yêu cầu; mỗi
+       câu trả lời được ghi ngay vào checkpoint nên chạy lại sẽ tiếp tục.
+    4. Ghi gọn index (câu hỏi chuẩn hóa + embedding) cho /api/v1/chat.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("faq_file", help="File câu hỏi (.txt mỗi dòng một câu, hoặc .json)")
+    parser.add_argument("--model", action="append", choices=["gemini", "qwen"],
+                        help="Model sinh câu trả lời, lặp lại để sinh cho nhiều model (mặc định: gemini)")
+    parser.add_argument("--out", default=config.FAQ_INDEX_DIR)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    models = args.model or ["gemini"]
+
+    questions = load_questions(args.faq_file)
+    print(f"Đọc {len(questions)} câu hỏi từ '{args.faq_file}'")
+    os.makedirs(args.out, exist_ok=True)
+    existing = read_answers(args.out)
+
+    retriever = build_retriever()
+    start = time.perf_counter()
+    results, embeddings = retriever.retrieve_batch(questions, top_k=args.top_k)
+    print(f"Truy xuất {len(questions)} câu hỏi trong {time.perf_counter() - start:.1f}s")
+
+    keys = [normalize_query(question) for question in questions]
+    fingerprints = [context_fingerprint(chunks) for chunks in results]
+
+    checkpoint_lock = threading.Lock()
+    checkpoint = open(os.path.join(args.out, ANSWERS_FILE), "a", encoding="utf-8")
+    counts = {"skipped": 0, "generated": 0, "failed": 0}
+
+    def answer_one(generator, model: str, i: int):
+        response = generator.generate_answer(questions[i], results[i])
+        if response.get("status") == "error":
+            print(f"[{model}] Lỗi với câu '{questions[i]}': {response.get('answer')}")
+            return None
+        entry = {
+            "key": keys[i],
+            "model": model,
+            "question": questions[i],
+            "context_fingerprint": fingerprints[i],
+            "top_k": args.top_k,
+            "answer": response["answer"],
+            "sources": response["sources"],
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with checkpoint_lock:
+            checkpoint.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+        return entry
+
+    try:
+        for model in models:
+            pending = []
+            for i, key in enumerate(keys):
+                entry = existing.get((key, model))
+                if entry is not None and entry.get("context_fingerprint") == fingerprints[i]:
+                    counts["skipped"] += 1
+                elif results[i]:
+                    pending.append(i)
+            if not pending:
+                continue
+            generator = build_generator(model)
+            print(f"[{model}] Sinh {len(pending)} câu trả lời (song song {args.concurrency})...")
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                futures = [pool.submit(answer_one, generator, model, i) for i in pending]
+                for done, future in enumerate(as_completed(futures), 1):
+                    entry = future.result()
+                    if entry is None:
+                        counts["failed"] += 1
+                    else:
+                        existing[(entry["key"], entry["model"])] = entry
+                        counts["generated"] += 1
+                    if done % 10 == 0 or done == len(futures):
+                        print(f"[{model}] {done}/{len(futures)}")
+    finally:
+        checkpoint.close()
+
+    # Chỉ giữ các câu còn trong file FAQ hiện tại; câu lỗi sẽ được sinh lại ở lần chạy sau
+    current = set(keys)
+    entries: List[Dict] = [entry for (key, _), entry in existing.items() if key in current]
+    write_index(args.out, entries, keys, embeddings)
+    print(f"Hoàn thành: sinh mới {counts['generated']}, bỏ qua (bối cảnh không đổi) {counts['skipped']}, "
+          f"lỗi {counts['failed']}. Index FAQ: {len(entries)} câu trả lời tại '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
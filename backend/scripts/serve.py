@@ -0,0 +1,72 @@
+import os
+import sys
+import pickle
+import argparse
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from src.core import config
+from src.services.index_store import file_version, read_manifest
+
+
+def ensure_shared_index(index_dir: str, force: bool = False):
+    """
+    Build index dùng chung một lần ở tiến trình cha nếu chưa có hoặc đã cũ
+    so với file embedding. Các worker chỉ mmap, không build lại.
+    """
+    source_version = file_version(config.EMBEDDINGS_FILE_PATH)
+    manifest = read_manifest(index_dir)
+    if not force and manifest is not None and manifest.get("source_version") == source_version \
+            and manifest["bm25_params"].get("bigrams", False) == config.BM25_BIGRAMS:
+        print(f"Index dùng chung tại '{index_dir}' đã mới nhất.")
+        return
+
+    # Import muộn: tiến trình cha chỉ cần các lớp này khi phải build lại
+    from src.services.retrieval import HybridRetriever
+
+    print(f"Build index dùng chung từ '{config.EMBEDDINGS_FILE_PATH}'...")
+    with open(config.EMBEDDINGS_FILE_PATH, 'rb') as f:
+        embedded_chunks = pickle.load(f)
+    # Không cần model embedding để build index
+    retriever = HybridRetriever(embedded_chunks, embedding_pipeline=None, bm25_bigrams=config.BM25_BIGRAMS)
+    retriever.save_index(index_dir, source_version=source_version)
+
+
+def main():
+    """
+    Chế độ triển khai nhiều worker: build index một lần rồi chạy uvicorn với
+    USE_SHARED_INDEX=true để mọi worker gắn vào cùng các file mmap.
+    """
+    parser = argparse.ArgumentParser()
+    # Mặc định một worker: phiên chat chỉ nằm trong bộ nhớ worker đã tạo nó
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Số worker; >1 cần load balancer định tuyến theo session_id cho chat theo phiên")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--rebuild", action="store_true", help="Build lại index kể cả khi còn mới")
+    parser.add_argument("--mode", choices=["full", "retrieval"], default=config.SERVER_MODE,
+                        help="retrieval: worker chỉ truy xuất, không khởi tạo generator")
+    parser.add_argument("--build-only", action="store_true",
+                        help="Chỉ build lại index rồi thoát; các worker đang chạy tự nạp index mới (INDEX_WATCH_INTERVAL)")
+    args = parser.parse_args()
+
+    ensure_shared_index(config.SHARED_INDEX_DIR, force=args.rebuild)
+    if args.build_only:
+        return
+    if args.workers > 1 and args.mode == "full":
+        print(f"Lưu ý: phiên chat (/api/v1/chat/session) nằm trong bộ nhớ từng worker; với {args.workers} worker "
+              "cần load balancer định tuyến theo session_id, nếu không các lượt sau sẽ nhận 404.")
+
+    # Worker được spawn sẽ kế thừa biến môi trường này
+    os.environ["USE_SHARED_INDEX"] = "true"
+    os.environ["SHARED_INDEX_DIR"] = config.SHARED_INDEX_DIR
+    os.environ["SERVER_MODE"] = args.mode
+    os.chdir(project_root)
+
+    import uvicorn
+    uvicorn.run("src.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
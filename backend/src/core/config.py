@@ -20,6 +20,10 @@ PREPROCESSED_DATA_DIR = os.path.join(BACKEND_DIR, "data_processed")
 CHUNKS_JSON_PATH = os.path.join(PREPROCESSED_DATA_DIR, "vietnam_history_chunks.json")
 EMBEDDINGS_FILE_PATH = os.path.join(PREPROCESSED_DATA_DIR, "vietnam_history_embeddings.pkl")
 
+# Index dùng chung (mmap) cho chế độ nhiều worker, build bởi scripts/serve.py
+SHARED_INDEX_DIR = os.getenv("SHARED_INDEX_DIR", os.path.join(PREPROCESSED_DATA_DIR, "index"))
+USE_SHARED_INDEX = os.getenv("USE_SHARED_INDEX", "false").lower() == "true"
+
 
 # --- MODEL & API CONFIGURATION ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -28,11 +32,93 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 EMBEDDING_MODEL_NAME = 'keepitreal/vietnamese-sbert'
 GENERATION_MODEL_NAME = 'gemini-2.5-flash' 
 
+# --- SERVER MODE ---
+# "full": truy xuất + sinh câu trả lời; "retrieval": chỉ truy xuất, không khởi tạo generator / Gemini SDK
+SERVER_MODE = os.getenv("SERVER_MODE", "full").lower()
+RETRIEVAL_ONLY = SERVER_MODE == "retrieval"
+
 # --- RETRIEVER CONFIGURATION ---
 SEMANTIC_WEIGHT = 0.5
 KEYWORD_WEIGHT = 0.5
+# Truy xuất thích ứng: số ứng viên rerank mặc định / khi điểm phẳng
+ADAPTIVE_RETRIEVAL = os.getenv("ADAPTIVE_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+RETRIEVAL_CANDIDATE_K = int(os.getenv("RETRIEVAL_CANDIDATE_K", "20"))
+RETRIEVAL_MAX_CANDIDATE_K = int(os.getenv("RETRIEVAL_MAX_CANDIDATE_K", "40"))
+# Bỏ rerank khi tại điểm cắt, chunk cuối được giữ hơn chunk đầu tiên bị bỏ ít nhất chừng này
+# (tỉ lệ so với điểm cao nhất) và ít nhất chừng này chunk top_k trùng nhau giữa semantic và BM25.
+# 0.05: trên 150 truy vấn known-item, mọi lần early exit ở top_k=5 trả về đúng tập chunk của rerank
+RETRIEVAL_CONFIDENT_MARGIN = float(os.getenv("RETRIEVAL_CONFIDENT_MARGIN", "0.05"))
+RETRIEVAL_MIN_AGREEMENT = float(os.getenv("RETRIEVAL_MIN_AGREEMENT", "0.4"))
+# Điểm kết hợp chênh nhau ít hơn chừng này trên RETRIEVAL_CANDIDATE_K ứng viên được coi là phẳng
+RETRIEVAL_FLAT_SPREAD = float(os.getenv("RETRIEVAL_FLAT_SPREAD", "0.08"))
+# Ngân sách (ms) cho bước chấm điểm; vượt thì bỏ rerank. 0 = không giới hạn
+RETRIEVAL_LATENCY_BUDGET_MS = float(os.getenv("RETRIEVAL_LATENCY_BUDGET_MS", "0"))
+# Quiz: số chunk bối cảnh khi chủ đề rõ ràng / mặc định
+QUIZ_CONTEXT_MIN_K = int(os.getenv("QUIZ_CONTEXT_MIN_K", "3"))
+QUIZ_CONTEXT_K = int(os.getenv("QUIZ_CONTEXT_K", "5"))
+# Thêm token ghép 2 âm tiết vào BM25 để tên riêng nhiều âm tiết được chấm như một đơn vị
+BM25_BIGRAMS = os.getenv("BM25_BIGRAMS", "false").lower() == "true"
 
 # Ollama
 OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
 OLLAMA_MODEL_NAME = os.getenv("OLLAMA_MODEL_NAME", "qwen3:1.7b")
+# Danh sách nhiều Ollama host, phân tách bởi dấu phẩy. Mỗi host có thể kèm giới
+# hạn số yêu cầu đồng thời: "http://gpu1:11434|4,http://gpu2:11434|2"
+OLLAMA_API_URLS = [u.strip() for u in os.getenv("OLLAMA_API_URLS", OLLAMA_API_URL).split(",") if u.strip()]
+# Giới hạn đồng thời mặc định cho host không ghi rõ (0 = không giới hạn)
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "0"))
+
+
+# Thời gian Ollama giữ model (và KV-cache của phần prompt cố định) trong bộ nhớ
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# --- LLM TRANSPORT CONFIGURATION ---
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+LLM_ANSWER_DEADLINE = float(os.getenv("LLM_ANSWER_DEADLINE", "120"))
+LLM_QUIZ_DEADLINE = float(os.getenv("LLM_QUIZ_DEADLINE", "180"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_TIMEOUT = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+LLM_HEALTH_PROBE_INTERVAL = float(os.getenv("LLM_HEALTH_PROBE_INTERVAL", "15"))
+# Khi model được chọn không khả dụng, chuyển sang model còn lại
+LLM_FAILOVER = os.getenv("LLM_FAILOVER", "false").lower() == "true"
+
+# --- QUIZ POOL CONFIGURATION ---
+# Số câu hỏi sinh sẵn cho mỗi (chủ đề, model); 0 = tắt (mặc định, bật khi cần vì tốn lượt gọi LLM)
+QUIZ_POOL_SIZE = int(os.getenv("QUIZ_POOL_SIZE", "0"))
+# Số câu hỏi mỗi lần gọi LLM để nạp lại pool
+QUIZ_POOL_BATCH_SIZE = int(os.getenv("QUIZ_POOL_BATCH_SIZE", "5"))
+# Các chủ đề phổ biến, phân tách bởi dấu phẩy; chuỗi rỗng = không có chủ đề
+QUIZ_POOL_TOPICS = [t.strip() for t in os.getenv("QUIZ_POOL_TOPICS", "").split(",")]
+QUIZ_POOL_MODELS = [m.strip() for m in os.getenv("QUIZ_POOL_MODELS", "gemini,qwen").split(",") if m.strip()]
+QUIZ_POOL_REFILL_INTERVAL = float(os.getenv("QUIZ_POOL_REFILL_INTERVAL", "30"))
+# Số lần yêu cầu sinh bù khi model trả thiếu câu hỏi hợp lệ
+QUIZ_MAX_REFILL_ROUNDS = int(os.getenv("QUIZ_MAX_REFILL_ROUNDS", "1"))
+
+# --- CHAT SESSION CONFIGURATION ---
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+# Giới hạn bộ nhớ mỗi phiên: số lượt hội thoại, tổng ký tự prompt + câu trả lời, số chunk nhớ lại
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "4"))
+SESSION_MAX_CHARS = int(os.getenv("SESSION_MAX_CHARS", "24000"))
+SESSION_MAX_CHUNKS = int(os.getenv("SESSION_MAX_CHUNKS", "20"))
+# Hệ số giảm điểm của chunk lượt trước khi so với chunk mới truy xuất
+SESSION_CHUNK_DECAY = float(os.getenv("SESSION_CHUNK_DECAY", "0.8"))
+# Câu nối tiếp dùng lại chunk đã nhớ, không truy xuất lại, nếu ít nhất SESSION_REUSE_MIN_CHUNKS
+# chunk (hoặc top_k nếu nhỏ hơn) còn có cosine với câu hỏi viết lại >= SESSION_REUSE_MIN_SIMILARITY
+SESSION_REUSE_MIN_SIMILARITY = float(os.getenv("SESSION_REUSE_MIN_SIMILARITY", "0.5"))
+SESSION_REUSE_MIN_CHUNKS = int(os.getenv("SESSION_REUSE_MIN_CHUNKS", "3"))
+
+# --- INDEX RELOAD CONFIGURATION ---
+# Chu kỳ (giây) kiểm tra file dữ liệu/index thay đổi để nạp lại; 0 = tắt, chỉ nạp lại qua endpoint admin
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "30"))
+# Token cho các endpoint /api/v1/admin/*; để trống thì các endpoint admin bị tắt
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
+# --- FAQ ANSWER INDEX ---
+# Câu trả lời sinh sẵn bởi scripts/precompute_faq.py; /api/v1/chat tra ở đây trước
+FAQ_INDEX_DIR = os.getenv("FAQ_INDEX_DIR", os.path.join(PREPROCESSED_DATA_DIR, "faq_index"))
+# Độ tương đồng cosine tối thiểu giữa câu hỏi và câu FAQ để dùng câu trả lời sinh sẵn; >1 = chỉ khớp nguyên văn
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.92"))
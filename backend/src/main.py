@@ -1,37 +1,91 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from pydantic import BaseModel
 import os
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Optional
+from fastapi.responses import StreamingResponse
+from typing import Dict, Iterator, List, Optional, Tuple
+import hmac
+import json
+from contextlib import ExitStack
+import numpy as np
 
 from .core import config
 from .services.embedding import EmbeddingPipeline
-from .services.retrieval import HybridRetriever
+from .services.retrieval import HybridRetriever, RetrievalStats
 from .services.generation import (
     BaseRAGGenerator, 
     GeminiRAGGenerator, 
     QwenOllamaGenerator,
+    FailoverGenerator,
     log_retrieved_chunks 
 )
+from .services.singleflight import SingleFlight, normalize_query
+from .services.quiz import QuizPool
+from .services.index_store import MANIFEST_FILE, file_version
+from .services.index_manager import IndexManager
+from .services.session import SessionState, SessionStore
+from .services.faq import FaqIndex
+from .services.chunk_store import RetrievedChunk
 
 print("load embedding...")
 embedding_pipeline = EmbeddingPipeline(model_name=config.EMBEDDING_MODEL_NAME)
-print(f"load data embedding... '{config.EMBEDDINGS_FILE_PATH}'...")
-embedded_chunks = embedding_pipeline.load_embeddings(config.EMBEDDINGS_FILE_PATH)
-print("create retriever...")
-retriever = HybridRetriever(
-    embedded_chunks=embedded_chunks,
-    embedding_pipeline=embedding_pipeline,
-    semantic_weight=config.SEMANTIC_WEIGHT,
-    keyword_weight=config.KEYWORD_WEIGHT
-)
-print("create generators...")
-generators: Dict[str, BaseRAGGenerator] = {
-    "gemini": GeminiRAGGenerator(),
-    "qwen": QwenOllamaGenerator()
-}
-print("Gemini Generator Loaded.")
-print("Qwen Generator Loaded.")
+
+def _load_retriever() -> HybridRetriever:
+    if config.USE_SHARED_INDEX:
+        # Chế độ nhiều worker: index đã được tiến trình cha build, chỉ cần mmap
+        print(f"attach shared index... '{config.SHARED_INDEX_DIR}'...")
+        return HybridRetriever.from_index_dir(
+            config.SHARED_INDEX_DIR,
+            embedding_pipeline=embedding_pipeline,
+            semantic_weight=config.SEMANTIC_WEIGHT,
+            keyword_weight=config.KEYWORD_WEIGHT
+        )
+    print(f"load data embedding... '{config.EMBEDDINGS_FILE_PATH}'...")
+    embedded_chunks = embedding_pipeline.load_embeddings(config.EMBEDDINGS_FILE_PATH)
+    print("create retriever...")
+    return HybridRetriever(
+        embedded_chunks=embedded_chunks,
+        embedding_pipeline=embedding_pipeline,
+        semantic_weight=config.SEMANTIC_WEIGHT,
+        keyword_weight=config.KEYWORD_WEIGHT,
+        bm25_bigrams=config.BM25_BIGRAMS
+    )
+
+def _index_version() -> str:
+    # Chế độ dùng chung theo dõi manifest (scripts/serve.py --build-only ghi lại), còn lại theo dõi file embedding
+    if config.USE_SHARED_INDEX:
+        return file_version(os.path.join(config.SHARED_INDEX_DIR, MANIFEST_FILE))
+    return file_version(config.EMBEDDINGS_FILE_PATH)
+
+index_manager = IndexManager(_load_retriever, _index_version)
+generators: Dict[str, BaseRAGGenerator] = {}
+if config.RETRIEVAL_ONLY:
+    # Microservice truy xuất / test: không khởi tạo generator, không tải Gemini SDK
+    print("Chế độ chỉ truy xuất (SERVER_MODE=retrieval): bỏ qua generators.")
+else:
+    print("create generators...")
+    gemini_generator = GeminiRAGGenerator()
+    qwen_generator = QwenOllamaGenerator()
+    generators = {
+        "gemini": gemini_generator,
+        "qwen": qwen_generator
+    }
+    if config.LLM_FAILOVER:
+        # Model được chọn lỗi thì chuyển sang model còn lại
+        generators = {
+            "gemini": FailoverGenerator(gemini_generator, qwen_generator),
+            "qwen": FailoverGenerator(qwen_generator, gemini_generator)
+        }
+        print("Đã bật failover giữa Gemini và Qwen.")
+    print("Gemini Generator Loaded.")
+    print("Qwen Generator Loaded.")
+
+chat_flight = SingleFlight()
+faq_index = None if config.RETRIEVAL_ONLY else FaqIndex.load(config.FAQ_INDEX_DIR)
+retrieval_stats = RetrievalStats()
+session_store = SessionStore()
+
+DEFAULT_QUIZ_QUERY = "Các sự kiện lịch sử Việt Nam 1954-1975"
 
 # Khởi tạo FastAPI app
 app = FastAPI(title="Lich Su Vietnam RAG API")
@@ -61,71 +115,233 @@ class QueryRequest(BaseModel):
     top_k: int = 5 
     model: str = "gemini"
 
+class SessionQueryRequest(BaseModel):
+    query: str
+    session_id: Optional[str] = None # bỏ trống để mở phiên mới; id không có trên worker này trả về 404
+    top_k: int = 5
+    model: str = "gemini"
+
 # Pydantic model cho Quiz Request
 class QuizRequest(BaseModel):
     topic: Optional[str] = None 
     k: int = 3 # k câu hỏi
     model: str = "gemini"
+    stream: bool = False # trả về NDJSON, mỗi câu hỏi một dòng ngay khi sinh xong
+
+class RetrieveRequest(BaseModel):
+    query: str
+    top_k: int = 5
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Vietnamese History RAG API!"}
 
+def _get_generator(model: str) -> BaseRAGGenerator:
+    if config.RETRIEVAL_ONLY:
+        raise HTTPException(
+            status_code=503,
+            detail="Server đang chạy ở chế độ chỉ truy xuất (SERVER_MODE=retrieval), không sinh câu trả lời."
+        )
+    generator = generators.get(model)
+    if not generator:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Model '{model}' không hợp lệ. Chỉ chấp nhận 'gemini' hoặc 'qwen'."
+        )
+    return generator
+
+@app.post("/api/v1/retrieve")
+def retrieve_chunks(request: RetrieveRequest):
+    """
+    Chỉ truy xuất, không gọi LLM; dùng được ở mọi chế độ server.
+    """
+    with index_manager.acquire() as retriever:
+        retrieved_chunks = _retrieve(retriever, request.query, request.top_k)
+        return {"query": request.query, "chunks": [chunk.to_dict() for chunk in retrieved_chunks]}
+
 @app.post("/api/v1/chat")
 def chat_with_history(request: QueryRequest):
     print(f"Received query: '{request.query}' with top_k={request.top_k}, model='{request.model}'")
-    generator_to_use = generators.get(request.model)
-    if not generator_to_use:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Model '{request.model}' không hợp lệ. Chỉ chấp nhận 'gemini' hoặc 'qwen'."
+    generator_to_use = _get_generator(request.model)
+
+    # Các yêu cầu giống hệt nhau đang xử lý đồng thời dùng chung một lần tra FAQ + truy xuất + sinh
+    flight_key = (normalize_query(request.query), request.model, request.top_k)
+    result, shared = chat_flight.do(
+        flight_key,
+        lambda: _answer_query(request.query, request.top_k, request.model, generator_to_use)
+    )
+    if shared:
+        print(f"Dùng chung kết quả với yêu cầu đang xử lý cho: '{request.query}' "
+              f"(đã gộp {chat_flight.shared}/{chat_flight.executed + chat_flight.shared} yêu cầu)")
+        # Giữ nguyên câu hỏi gốc của yêu cầu này (có thể khác hoa/thường, dấu câu)
+        result = {**result, "query": request.query}
+    return result
+
+def _lookup_faq(retriever: HybridRetriever, query: str, model: str) -> Tuple[Optional[Dict], Optional[np.ndarray]]:
+    """
+    Tra index FAQ: khớp câu hỏi chuẩn hóa, rồi khớp theo embedding. Trả về
+    (kết quả nếu trúng, embedding câu hỏi nếu đã tính) để truy xuất không phải embed lại.
+    Câu trả lời sinh trên bối cảnh khác index đang phục vụ (sau khi hoán đổi) bị bỏ qua.
+    """
+    faq = faq_index
+    if faq is None:
+        return None, None
+    entry, similarity, query_embedding = faq.lookup(query, model), 1.0, None
+    if entry is None and faq.embeddings is not None:
+        query_embedding = retriever.embed_query(query)
+        match = faq.lookup_similar(query_embedding, model)
+        if match is not None:
+            entry, similarity = match
+    if entry is None:
+        return None, query_embedding
+    if not faq.is_current(entry, retriever):
+        print(f"Bỏ qua câu trả lời FAQ đã cũ so với index hiện tại: '{entry['question']}'")
+        return None, query_embedding
+    print(f"Trả lời từ FAQ sinh sẵn: '{entry['question']}' (độ tương đồng {similarity:.3f})")
+    return {
+        "query": query,
+        "response": {"answer": entry["answer"], "sources": entry["sources"]},
+        "faq_match": {"question": entry["question"], "similarity": round(similarity, 4)}
+    }, query_embedding
+
+def _retrieve(retriever: HybridRetriever, query: str, top_k: int, min_top_k: Optional[int] = None,
+              query_embedding: Optional[np.ndarray] = None) -> List[RetrievedChunk]:
+    """
+    Kết quả trỏ vào ChunkStore của `retriever`: người gọi phải giữ
+    index_manager.acquire() cho tới khi dựng xong prompt.
+    """
+    if config.ADAPTIVE_RETRIEVAL:
+        return retriever.retrieve_adaptive(query, top_k=top_k, min_top_k=min_top_k, stats=retrieval_stats,
+                                           query_embedding=query_embedding)
+    return retriever.retrieve_with_rerank(query=query, top_k=top_k, candidate_k=config.RETRIEVAL_CANDIDATE_K,
+                                          query_embedding=query_embedding)
+
+def _answer_query(query: str, top_k: int, model: str, generator_to_use: BaseRAGGenerator) -> Dict:
+    with index_manager.acquire() as retriever:
+        # Câu hỏi thuộc FAQ đã sinh sẵn: trả lời ngay, không cần LLM
+        faq_result, query_embedding = _lookup_faq(retriever, query, model)
+        if faq_result is not None:
+            return faq_result
+
+        if not generator_to_use.is_ready():
+            raise HTTPException(
+                status_code=500,
+                detail=f"hệ thống sinh câu trả lời cho model '{model}' không khả dụng. Kiểm tra log server."
+            )
+
+        print(f"Đang truy xuất {top_k} chunk liên quan...")
+        retrieved_chunks = _retrieve(retriever, query, top_k, query_embedding=query_embedding)
+        
+        if not retrieved_chunks:
+            return {
+                "query": query,
+                "response": {
+                    "answer": "Rất tiếc, tôi không tìm thấy bất kỳ tài liệu nào liên quan đến câu hỏi của bạn.",
+                    "sources": []
+                }
+            }
+
+        log_retrieved_chunks(query, retrieved_chunks)
+
+        print(f"Đang sinh câu trả lời (sử dụng model {model})...")
+        
+        final_response = generator_to_use.generate_answer(
+            query=query,
+            context_chunks=retrieved_chunks
         )
     
+    return {"query": query, "response": final_response}
+
+@app.post("/api/v1/chat/session")
+def chat_in_session(request: SessionQueryRequest):
+    """
+    Chat nhiều lượt: câu hỏi nối tiếp được viết lại dựa trên câu hỏi trước,
+    chunk của lượt trước được dùng lại, và chỉ bối cảnh mới được gửi cho LLM.
+    """
+    generator_to_use = _get_generator(request.model)
     if not generator_to_use.is_ready():
         raise HTTPException(
             status_code=500,
             detail=f"hệ thống sinh câu trả lời cho model '{request.model}' không khả dụng. Kiểm tra log server."
         )
-    
-    print(f"Đang truy xuất {request.top_k} chunk liên quan...")
-    retrieved_chunks = retriever.retrieve_with_rerank(
-        query=request.query, 
-        top_k=request.top_k,
-        candidate_k=20 
-    )
-    
-    if not retrieved_chunks:
-        return {
-            "query": request.query,
-            "response": {
-                "answer": "Rất tiếc, tôi không tìm thấy bất kỳ tài liệu nào liên quan đến câu hỏi của bạn.",
-                "sources": []
+
+    if request.session_id:
+        state = session_store.get(request.session_id)
+        if state is None:
+            # Phiên chỉ nằm trong bộ nhớ của worker đã tạo nó
+            raise HTTPException(
+                status_code=404,
+                detail=f"Không tìm thấy phiên '{request.session_id}': phiên đã hết hạn, hoặc yêu cầu được "
+                       "chuyển tới worker khác worker giữ phiên. Bỏ trống session_id để mở phiên mới."
+            )
+    else:
+        state = session_store.create()
+    # Các lượt trong cùng một phiên chạy tuần tự để lịch sử không bị lẫn
+    with state.lock, index_manager.acquire_with_version() as (retriever, index_version):
+        # Phiên bản của đúng index đã mượn, không phải index_manager.version (có thể vừa đổi)
+        state.sync_index(index_version)
+        retrieval_query, is_followup = state.rewrite(request.query)
+        print(f"Phiên {state.session_id}: '{request.query}'"
+              + (f" -> viết lại thành '{retrieval_query}'" if is_followup else ""))
+        context_chunks, query_embedding = _reuse_session_chunks(retriever, state, retrieval_query, is_followup, request.top_k)
+        if context_chunks is None:
+            retrieved_chunks = _retrieve(retriever, retrieval_query, request.top_k, query_embedding=query_embedding)
+            context_chunks = state.merge_chunks(retrieved_chunks, request.top_k, retriever.store)
+        if not context_chunks:
+            return {
+                "session_id": state.session_id,
+                "query": request.query,
+                "response": {
+                    "answer": "Rất tiếc, tôi không tìm thấy bất kỳ tài liệu nào liên quan đến câu hỏi của bạn.",
+                    "sources": []
+                }
             }
-        }
+        log_retrieved_chunks(retrieval_query, context_chunks)
 
-    log_retrieved_chunks(request.query, retrieved_chunks)
+        sent_ids = state.sent_chunk_ids()
+        new_chunks = [chunk for chunk in context_chunks if chunk.chunk_id not in sent_ids]
+        print(f"Dùng lại {len(context_chunks) - len(new_chunks)} chunk đã gửi, gửi thêm {len(new_chunks)} chunk mới.")
+        final_response = generator_to_use.generate_session_answer(
+            query=request.query,
+            context_chunks=context_chunks,
+            new_chunks=new_chunks,
+            history=state.history()
+        )
+        prompt = final_response.pop("prompt", None)
+        if prompt is not None:
+            state.record_turn(request.query, is_followup, prompt, final_response["answer"],
+                              context_chunks, [chunk.chunk_id for chunk in new_chunks])
 
-    print(f"Đang sinh câu trả lời (sử dụng model {request.model})...")
-    
-    final_response = generator_to_use.generate_answer(
-        query=request.query,
-        context_chunks=retrieved_chunks
-    )
-    
-    return {"query": request.query, "response": final_response}
+    return {
+        "session_id": state.session_id,
+        "query": request.query,
+        "rewritten_query": retrieval_query if is_followup else None,
+        "response": final_response
+    }
+
+def _reuse_session_chunks(retriever: HybridRetriever, state: SessionState, query: str, is_followup: bool,
+                          top_k: int) -> Tuple[Optional[List[RetrievedChunk]], Optional[np.ndarray]]:
+    """
+    Câu nối tiếp: chấm lại các chunk phiên đã nhớ với câu hỏi viết lại. Nếu đủ
+    chunk còn liên quan thì dùng luôn, bỏ qua truy xuất toàn corpus. Trả về
+    (chunk dùng lại hoặc None, embedding câu hỏi để truy xuất không phải embed lại).
+    """
+    if not is_followup or not state.chunks:
+        return None, None
+    query_embedding = retriever.embed_query(query)
+    candidates = retriever.rerank_chunk_ids(query, state.chunks.keys(), top_k=top_k, query_embedding=query_embedding)
+    relevant = [chunk for chunk in candidates if chunk.semantic_score >= config.SESSION_REUSE_MIN_SIMILARITY]
+    if len(relevant) < min(top_k, config.SESSION_REUSE_MIN_CHUNKS):
+        return None, query_embedding
+    print(f"Dùng lại {len(relevant)} chunk của phiên, bỏ qua truy xuất.")
+    return relevant, query_embedding
 
 # endpoint sinh câu hỏi trắc nghiệm
 @app.post("/api/v1/generate_quiz")
 def generate_quiz(request: QuizRequest):
     print(f"Received quiz request: k={request.k}, topic='{request.topic}', model='{request.model}'")
     # Chọn Generator
-    generator_to_use = generators.get(request.model)
-
-    if not generator_to_use:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Model '{request.model}' không hợp lệ. Chỉ chấp nhận 'gemini' hoặc 'qwen'."
-        )
+    generator_to_use = _get_generator(request.model)
     
     if not generator_to_use.is_ready():
         raise HTTPException(
@@ -133,38 +349,173 @@ def generate_quiz(request: QuizRequest):
             detail=f"Dịch vụ sinh câu trả lời cho model '{request.model}' không khả dụng."
         )
 
+    # Phục vụ ngay từ pool sinh sẵn nếu có
+    pooled_questions = quiz_pool.take(request.topic, request.model, request.k)
+    if pooled_questions is not None:
+        print(f"Trả về {len(pooled_questions)} câu hỏi từ quiz pool.")
+        if request.stream:
+            return StreamingResponse(_quiz_ndjson(iter(pooled_questions)), media_type="application/x-ndjson")
+        return {"status": "success", "questions": pooled_questions}
+
+    with ExitStack() as stack:
+        retriever = stack.enter_context(index_manager.acquire())
+        query_for_retrieval, retrieved_chunks = _retrieve_quiz_context(retriever, request.topic)
+        
+        if not retrieved_chunks:
+            return {
+                "status": "error",
+                "message": "Rất tiếc, tôi không tìm thấy bất kỳ tài liệu nào liên quan đến chủ đề này."
+            }
+        
+        log_retrieved_chunks(query_for_retrieval, retrieved_chunks)
+
+        # Sinh Câu hỏi
+        print(f"Đang sinh {request.k} câu hỏi trắc nghiệm (sử dụng model {request.model})...")
+
+        if request.stream:
+            # Prompt được dựng khi stream bắt đầu: chuyển việc trả index cho response
+            return _LeasedStreamingResponse(
+                stack.pop_all(),
+                _quiz_ndjson(generator_to_use.generate_quiz_stream(retrieved_chunks, request.k)),
+                media_type="application/x-ndjson"
+            )
+        
+        quiz_response = generator_to_use.generate_quiz(
+            context_chunks=retrieved_chunks,
+            k=request.k
+        )
+    
+    # quiz_response có dạng {"status": "...", "questions": ...} hoặc {"status": "error", "message": ...}
+    return quiz_response
+
+class _LeasedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse giữ index (qua `stack`) tới khi gửi xong. Index được trả
+    trong mọi trường hợp, kể cả khi client ngắt kết nối trước dòng đầu tiên
+    (lúc đó generator của body chưa bao giờ chạy nên finally của nó không chạy).
+    """
+    def __init__(self, stack: ExitStack, content: Iterator[str], **kwargs):
+        super().__init__(content, **kwargs)
+        self._stack = stack
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._stack.close()
+
+def _quiz_ndjson(questions: Iterator[Dict]) -> Iterator[str]:
+    """
+    Mỗi dòng: {"type": "question", "question": {...}}; dòng cuối là
+    {"type": "done", "count": n} hoặc {"type": "error", "message": ...}.
+    """
+    count = 0
+    try:
+        for question in questions:
+            count += 1
+            yield json.dumps({"type": "question", "question": question}, ensure_ascii=False) + "\n"
+    except Exception as e:
+        print(f"Lỗi khi stream quiz: {e}")
+        yield json.dumps({"type": "error", "message": f"Đã xảy ra lỗi khi sinh câu hỏi: {e}", "count": count},
+                         ensure_ascii=False) + "\n"
+        return
+    if count == 0:
+        yield json.dumps({"type": "error", "message": "Lỗi: Model trả về dữ liệu không đúng định dạng JSON."},
+                         ensure_ascii=False) + "\n"
+        return
+    yield json.dumps({"type": "done", "count": count}) + "\n"
+
+def _retrieve_quiz_context(retriever: HybridRetriever, topic: Optional[str]) -> Tuple[str, List[RetrievedChunk]]:
     # Lấy Ngữ cảnh
     # Nếu không có topic, dùng 1 query chung để lấy chunk ngẫu nhiên
-    if not request.topic or request.topic.strip() == "":
-        query_for_retrieval = "Các sự kiện lịch sử Việt Nam 1954-1975"
+    if not topic or topic.strip() == "":
+        query_for_retrieval = DEFAULT_QUIZ_QUERY
         print("Không có chủ đề, dùng query ngẫu nhiên...")
     else:
-        query_for_retrieval = request.topic
-    
-    # Lấy 5 chunk để làm ngữ cảnh
-    print(f"Đang truy xuất 5 chunk cho chủ đề: '{query_for_retrieval}'...")
-    retrieved_chunks = retriever.retrieve_with_rerank(
-        query=query_for_retrieval, 
-        top_k=5, 
-        candidate_k=20
-    )
-    
-    if not retrieved_chunks:
-        return {
-            "status": "error",
-            "message": "Rất tiếc, tôi không tìm thấy bất kỳ tài liệu nào liên quan đến chủ đề này."
-        }
+        query_for_retrieval = topic
     
-    log_retrieved_chunks(query_for_retrieval, retrieved_chunks)
+    # Chủ đề rõ ràng thì chỉ cần QUIZ_CONTEXT_MIN_K chunk, prompt ngắn hơn
+    print(f"Đang truy xuất {config.QUIZ_CONTEXT_K} chunk cho chủ đề: '{query_for_retrieval}'...")
+    retrieved_chunks = _retrieve(retriever, query_for_retrieval, config.QUIZ_CONTEXT_K, min_top_k=config.QUIZ_CONTEXT_MIN_K)
+    return query_for_retrieval, retrieved_chunks
 
-    # Sinh Câu hỏi
-    print(f"Đang sinh {request.k} câu hỏi trắc nghiệm (sử dụng model {request.model})...")
-    
-    quiz_response = generator_to_use.generate_quiz(
-        context_chunks=retrieved_chunks,
-        k=request.k
-    )
-    
-    # quiz_response có dạng {"status": "...", "questions": ...} hoặc {"status": "error", "message": ...}
-    return quiz_response
+def _produce_pooled_quiz(topic: str, model: str, k: int) -> List[Dict]:
+    """
+    Sinh câu hỏi cho quiz pool ở thread nền.
+    """
+    generator = generators.get(model)
+    if generator is None or not generator.is_ready():
+        return []
+    with index_manager.acquire() as retriever:
+        _, retrieved_chunks = _retrieve_quiz_context(retriever, topic)
+        if not retrieved_chunks:
+            return []
+        quiz_response = generator.generate_quiz(context_chunks=retrieved_chunks, k=k)
+    if quiz_response.get("status") != "success":
+        return []
+    return quiz_response.get("questions", [])
+
+def corpus_version() -> str:
+    # Theo index đang phục vụ để quiz pool bỏ câu hỏi cũ ngay sau khi hoán đổi index
+    return index_manager.version
+
+quiz_pool = None if config.RETRIEVAL_ONLY else QuizPool(
+    producer=_produce_pooled_quiz,
+    version_fn=corpus_version,
+    topics=config.QUIZ_POOL_TOPICS,
+    models=config.QUIZ_POOL_MODELS
+)
+
+def _check_admin_token(token: Optional[str]):
+    # Không cấu hình ADMIN_TOKEN thì tắt hẳn các endpoint admin
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoint admin bị tắt: chưa cấu hình ADMIN_TOKEN.")
+    # So sánh bytes: compare_digest với str chứa ký tự ngoài ASCII sẽ ném TypeError.
+    # Header được Starlette giải mã latin-1, encode lại latin-1 là đúng các byte client gửi
+    if token is None or not hmac.compare_digest(token.encode("latin-1"), config.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Sai hoặc thiếu X-Admin-Token.")
+
+@app.post("/api/v1/admin/reload_index")
+def reload_index(force: bool = False, x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Build index mới từ dữ liệu hiện tại ở nền rồi hoán đổi; các yêu cầu
+    đang chạy vẫn dùng index cũ cho tới khi xong.
+    """
+    _check_admin_token(x_admin_token)
+    started = index_manager.reload_async(force=force)
+    return {"status": "started" if started else "already_running", "index": index_manager.status()}
+
+@app.get("/api/v1/admin/index_status")
+def index_status(x_admin_token: Optional[str] = Header(default=None)):
+    _check_admin_token(x_admin_token)
+    return index_manager.status()
+
+@app.post("/api/v1/admin/reload_faq")
+def reload_faq(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Nạp lại index FAQ sau khi chạy scripts/precompute_faq.py.
+    """
+    global faq_index
+    _check_admin_token(x_admin_token)
+    faq_index = FaqIndex.load(config.FAQ_INDEX_DIR)
+    return {"status": "success", "entries": len(faq_index) if faq_index is not None else 0}
+
+@app.get("/api/v1/admin/retrieval_stats")
+def get_retrieval_stats(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Tần suất và thời gian trung bình của từng nhánh truy xuất thích ứng.
+    """
+    _check_admin_token(x_admin_token)
+    return {"adaptive": config.ADAPTIVE_RETRIEVAL, "paths": retrieval_stats.snapshot()}
+
+@app.on_event("startup")
+def start_background_workers():
+    index_manager.start()
+    if quiz_pool is not None:
+        quiz_pool.start()
 
+@app.on_event("shutdown")
+def stop_background_workers():
+    if quiz_pool is not None:
+        quiz_pool.stop()
+    index_manager.stop()
@@ -0,0 +1,182 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class TextBuffer(Sequence):
+    """
+    Danh sách text lưu trong một buffer UTF-8 liên tục (bytes hoặc mmap) kèm
+    mảng offset. Text chỉ được decode khi truy cập; `preview` chỉ decode phần đầu.
+    """
+    __slots__ = ("_buffer", "_offsets")
+
+    def __init__(self, buffer, offsets: np.ndarray):
+        self._buffer = buffer
+        self._offsets = offsets
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "TextBuffer":
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        return cls(b"".join(encoded), offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer) + self._offsets.nbytes
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return self._buffer[start:end].decode("utf-8")
+
+    def preview(self, idx: int, max_chars: int) -> str:
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        # Mỗi ký tự UTF-8 tối đa 4 byte; bỏ ký tự bị cắt dở ở cuối
+        end = min(end, start + 4 * max_chars)
+        return self._buffer[start:end].decode("utf-8", errors="ignore")[:max_chars]
+
+    def contains(self, idx: int, needle: bytes) -> bool:
+        """
+        Tìm chuỗi con (đã encode UTF-8) trực tiếp trong buffer, không decode.
+        """
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return self._buffer.find(needle, start, end) != -1
+
+    def write(self, buffer_path: str) -> np.ndarray:
+        with open(buffer_path, "wb") as f:
+            f.write(self._buffer)
+        return self._offsets
+
+
+class ChunkStore:
+    """
+    Kho chunk dạng cột: id, text (TextBuffer) và metadata được intern - các
+    chunk cùng hierarchy dùng chung một dict metadata, mỗi chunk chỉ giữ id.
+    """
+    def __init__(self, chunk_ids: np.ndarray, texts: TextBuffer,
+                 metadata_table: List[Dict[str, Any]], metadata_ids: np.ndarray):
+        self.chunk_ids = chunk_ids
+        self.texts = texts
+        self.metadata_table = metadata_table
+        self.metadata_ids = metadata_ids
+        self._positions: Optional[Dict[int, int]] = None
+
+    @classmethod
+    def from_columns(cls, chunk_ids: Sequence[int], texts: Iterable[str],
+                     metadatas: Iterable[Dict[str, Any]]) -> "ChunkStore":
+        table: List[Dict[str, Any]] = []
+        index: Dict[Tuple, int] = {}
+        ids = []
+        for metadata in metadatas:
+            key = tuple(sorted(metadata.items()))
+            meta_id = index.get(key)
+            if meta_id is None:
+                meta_id = index[key] = len(table)
+                table.append(metadata)
+            ids.append(meta_id)
+        return cls(
+            np.asarray(chunk_ids, dtype=np.int64),
+            TextBuffer.from_texts(texts),
+            table,
+            np.asarray(ids, dtype=np.int32)
+        )
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def chunk_id(self, idx: int) -> int:
+        return int(self.chunk_ids[idx])
+
+    def position(self, chunk_id: int) -> Optional[int]:
+        """
+        Vị trí trong store của một chunk id (None nếu không còn trong index này).
+        """
+        if self._positions is None:
+            self._positions = {int(cid): idx for idx, cid in enumerate(self.chunk_ids)}
+        return self._positions.get(int(chunk_id))
+
+    def content(self, idx: int) -> str:
+        return self.texts[idx]
+
+    def metadata(self, idx: int) -> Dict[str, Any]:
+        return self.metadata_table[self.metadata_ids[idx]]
+
+    def hierarchy_path(self, idx: int) -> str:
+        return self.metadata(idx).get("hierarchy_path", "N/A")
+
+
+class RetrievedChunk:
+    """
+    Kết quả truy xuất gọn nhẹ: chỉ giữ vị trí chunk trong ChunkStore và các
+    điểm số; nội dung và metadata được đọc từ store khi cần (lúc dựng prompt).
+    Hỗ trợ truy cập kiểu dict (`chunk["content"]`, `chunk.get(...)`) để tương
+    thích với code cũ dùng kết quả dạng dict.
+    """
+    __slots__ = ("store", "index", "rank", "combined_score", "semantic_score",
+                 "keyword_score", "rerank_score", "final_score", "_content")
+
+    def __init__(self, store: ChunkStore, index: int, rank: int, combined_score: float,
+                 semantic_score: Optional[float] = None, keyword_score: Optional[float] = None):
+        self.store = store
+        self.index = index
+        self.rank = rank
+        self.combined_score = combined_score
+        self.semantic_score = semantic_score
+        self.keyword_score = keyword_score
+        self.rerank_score: Optional[float] = None
+        self.final_score: Optional[float] = None
+        self._content: Optional[str] = None
+
+    @property
+    def chunk_id(self) -> int:
+        return self.store.chunk_id(self.index)
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            self._content = self.store.content(self.index)
+        return self._content
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.store.metadata(self.index)
+
+    @property
+    def hierarchy_path(self) -> str:
+        return self.store.hierarchy_path(self.index)
+
+    def preview(self, max_chars: int) -> str:
+        if self._content is not None:
+            return self._content[:max_chars]
+        return self.store.texts.preview(self.index, max_chars)
+
+    # Truy cập kiểu dict
+    _KEYS = ("rank", "chunk_id", "content", "metadata", "combined_score", "semantic_score",
+             "keyword_score", "rerank_score", "final_score")
+
+    def __getitem__(self, key: str):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self._KEYS if getattr(self, key) is not None}
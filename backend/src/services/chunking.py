@@ -1,15 +1,7 @@
-import numpy as np
-import pickle
 import re
-import math
-import os
 import json
-from typing import List, Dict, Any, Literal
+from typing import List, Dict, Any
 from dataclasses import dataclass, asdict
-from collections import Counter
-import tiktoken
-from sentence_transformers import SentenceTransformer
-
 
 @dataclass
 class Chunk:
@@ -31,6 +23,8 @@ class VietnameseHistoryChunker:
         self.min_chunk_size = min_chunk_size
         self.max_chunk_size = max_chunk_size
         try:
+            # Import muộn: chỉ bước tiền xử lý cần tiktoken
+            import tiktoken
             self.tokenizer = tiktoken.get_encoding(encoding_name)
         except:
             print("Warning: Không thể load tokenizer, dùng ước lượng")
@@ -2,7 +2,6 @@ import numpy as np
 import pickle
 from dataclasses import dataclass
 from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
 from .chunking import Chunk
 
 @dataclass
@@ -21,6 +20,9 @@ class EmbeddingPipeline:
     def _load_sbert_model(self):
         try:
             print(f"model: {self.model_name}...")
+            # Import muộn: torch/transformers chỉ được tải khi thực sự cần model embedding,
+            # không phải khi chỉ unpickle EmbeddedChunk hay build index
+            from sentence_transformers import SentenceTransformer
             self.model = SentenceTransformer(self.model_name)
             print(f"tải model thành công ({self.model.get_sentence_embedding_dimension()} dims)")
         except Exception as e:
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.config import FAQ_MATCH_THRESHOLD
+from .chunk_store import RetrievedChunk
+from .singleflight import normalize_query
+
+ANSWERS_FILE = "answers.jsonl"
+EMBEDDINGS_FILE = "question_embeddings.npy"
+KEYS_FILE = "question_keys.json"
+
+
+def context_fingerprint(chunks: List[RetrievedChunk]) -> str:
+    """
+    Dấu vân tay của tập chunk truy xuất được (id + nội dung), để biết câu
+    trả lời sinh sẵn còn ứng với cùng bối cảnh hay không.
+    """
+    digest = hashlib.sha1()
+    for chunk in chunks:
+        digest.update(str(chunk.chunk_id).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(chunk.content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def read_answers(index_dir: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    Đọc file checkpoint; dòng ghi sau của cùng (câu hỏi, model) đè dòng trước.
+    """
+    entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    path = os.path.join(index_dir, ANSWERS_FILE)
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Dòng cuối có thể dở dang nếu job bị ngắt giữa chừng
+                continue
+            entries[(entry["key"], entry["model"])] = entry
+    return entries
+
+
+def write_index(index_dir: str, entries: List[Dict[str, Any]], keys: List[str], embeddings: np.ndarray):
+    """
+    Ghi gọn index: mỗi (câu hỏi, model) một dòng, cùng ma trận embedding câu
+    hỏi (float32 đã chuẩn hóa) theo thứ tự keys.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_path = os.path.join(index_dir, ANSWERS_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, os.path.join(index_dir, ANSWERS_FILE))
+    np.save(os.path.join(index_dir, EMBEDDINGS_FILE), np.ascontiguousarray(embeddings, dtype=np.float32))
+    with open(os.path.join(index_dir, KEYS_FILE), "w", encoding="utf-8") as f:
+        json.dump(keys, f, ensure_ascii=False)
+
+
+class FaqIndex:
+    """
+    Tra câu trả lời sinh sẵn: khớp câu hỏi đã chuẩn hóa trước, sau đó khớp
+    theo embedding với ngưỡng FAQ_MATCH_THRESHOLD.
+    """
+    def __init__(self, entries: Dict[Tuple[str, str], Dict[str, Any]], keys: List[str],
+                 embeddings: Optional[np.ndarray], threshold: float = FAQ_MATCH_THRESHOLD):
+        self.entries = entries
+        self.keys = keys
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self._rows = {key: i for i, key in enumerate(keys)}
+        # Kết quả kiểm tra còn mới theo từng retriever; tự mất khi index cũ được giải phóng
+        self._verified: "weakref.WeakKeyDictionary[Any, Dict[Tuple[str, str], bool]]" = weakref.WeakKeyDictionary()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["FaqIndex"]:
+        entries = read_answers(index_dir)
+        if not entries:
+            return None
+        keys: List[str] = []
+        embeddings = None
+        keys_path = os.path.join(index_dir, KEYS_FILE)
+        if os.path.exists(keys_path):
+            with open(keys_path, "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        print(f"Đã nạp {len(entries)} câu trả lời FAQ từ '{index_dir}'")
+        return cls(entries, keys, embeddings)
+
+    def lookup(self, query: str, model: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get((normalize_query(query), model))
+
+    def lookup_similar(self, query_embedding: np.ndarray, model: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        if self.embeddings is None or len(self.keys) == 0 or self.threshold > 1.0:
+            return None
+        query_embedding = query_embedding / np.linalg.norm(query_embedding)
+        similarities = np.dot(self.embeddings, query_embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        entry = self.entries.get((self.keys[best], model))
+        if entry is None:
+            return None
+        return entry, float(similarities[best])
+
+    def is_current(self, entry: Dict[str, Any], retriever) -> bool:
+        """
+        Câu trả lời còn ứng với index đang phục vụ không: truy xuất lại câu hỏi
+        gốc như job sinh sẵn (cùng embedding, cùng top_k) rồi so dấu vân tay
+        bối cảnh. Chỉ kiểm tra một lần cho mỗi (câu hỏi, model) trên mỗi index.
+        """
+        verified = self._verified.setdefault(retriever, {})
+        entry_key = (entry["key"], entry["model"])
+        current = verified.get(entry_key)
+        if current is None:
+            row = self._rows.get(entry["key"])
+            query_embedding = self.embeddings[row] if row is not None and self.embeddings is not None else None
+            chunks = retriever.retrieve_with_rerank(
+                entry["question"],
+                top_k=entry.get("top_k", len(entry["sources"])),
+                query_embedding=query_embedding
+            )
+            current = context_fingerprint(chunks) == entry.get("context_fingerprint")
+            verified[entry_key] = current
+        return current
@@ -1,41 +1,51 @@
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-from typing import List, Dict, Set
+from typing import Iterator, List, Dict, Set, Tuple
 import requests
 import os
-import json
 
 from src.core.config import (
     GEMINI_API_KEY, 
     GENERATION_MODEL_NAME,
-    OLLAMA_API_URL,
-    OLLAMA_MODEL_NAME 
+    OLLAMA_API_URLS,
+    OLLAMA_MAX_CONCURRENCY,
+    OLLAMA_MODEL_NAME,
+    OLLAMA_KEEP_ALIVE,
+    LLM_ANSWER_DEADLINE,
+    LLM_QUIZ_DEADLINE,
+    QUIZ_MAX_REFILL_ROUNDS
 )
+from src.services.llm_client import (
+    CircuitBreaker,
+    LoadBalancedTransport,
+    LLMUnavailableError,
+    call_with_retry
+)
+from src.services.quiz import QuizStreamParser
+from src.services.chunk_store import RetrievedChunk
 
 # in log
-def log_retrieved_chunks(query: str, context_chunks: List[Dict]):
+def log_retrieved_chunks(query: str, context_chunks: List[RetrievedChunk]):
     print("\n" + "="*80)
     print(f"Đã truy vấn được {len(context_chunks)} chunks cho câu hỏi: '{query}'")
     
     unique_sources_paths: Set[str] = set()
     for i, chunk in enumerate(context_chunks):
-        source_path = chunk.get("metadata", {}).get("hierarchy_path", "N/A")
+        source_path = chunk.hierarchy_path
         unique_sources_paths.add(source_path)
         
-        final_score = chunk.get("final_score", 0.0)
-        rerank_score = chunk.get("rerank_score", 0.0)
-        combined_score = chunk.get("combined_score", 0.0)
-        semantic_score = chunk.get("semantic_score", 0.0)
-        keyword_score = chunk.get("keyword_score", 0.0)
+        final_score = chunk.final_score or 0.0
+        rerank_score = chunk.rerank_score or 0.0
+        combined_score = chunk.combined_score or 0.0
+        semantic_score = chunk.semantic_score or 0.0
+        keyword_score = chunk.keyword_score or 0.0
 
-        print(f"\n--- Chunk {i+1} (Rank: {chunk.get('rank', 'N/A')}) ---")
+        print(f"\n--- Chunk {i+1} (Rank: {chunk.rank}) ---")
         print(f" 	- Nguồn 	 	 	: {source_path}")
         print(f" 	- Điểm số cuối cùng: {final_score:.4f}")
         print(f" 	 	 	├─ Rerank 	: {rerank_score:.4f}")
         print(f" 	 	 	├─ Combined 	: {combined_score:.4f}")
         print(f" 	 	 	│ 	 ├─ Semantic: {semantic_score:.4f} (vector search)")
         print(f" 	 	 	│ 	 └─ Keyword : {keyword_score:.4f} (BM25)")
-        print(f" 	- Nội dung 	 	 	: \"{chunk.get('content', '')[:250]}...\"")
+        print(f" 	- Nội dung 	 	 	: \"{chunk.preview(250)}...\"")
     
     print("\n" + "="*80)
     print("Nguồn chính được sử dụng để tổng hợp câu trả lời:")
@@ -47,85 +57,101 @@ def log_retrieved_chunks(query: str, context_chunks: List[Dict]):
     print("="*80)
 
 
-class BaseRAGGenerator:
-    def _create_prompt(self, query: str, context_chunks: List[Dict]) -> str:
-        context_texts = [chunk['content'] for chunk in context_chunks]
-        context = "\n\n---\n\n".join(context_texts)
+# Phần chỉ dẫn cố định của prompt. Giữ nguyên từng byte giữa các lần gọi để
+# Ollama tái sử dụng KV-cache của tiền tố (Gemini nhận phần này qua system_instruction).
+ANSWER_SYSTEM_PROMPT = (
+    "Bạn là một trợ lý AI chuyên gia về Lịch sử Việt Nam giai đoạn kháng chiến chống Mỹ (1954-1975).\n"
+    "Nhiệm vụ của bạn là trả lời câu hỏi của người dùng chỉ dựa vào bối cảnh được cung cấp.\n"
+    "\n"
+    "Dựa vào **CHỈ** bối cảnh được cung cấp, hãy trả lời câu hỏi một cách chi tiết, chính xác và mạch lạc.\n"
+    "- Nếu thông tin không có trong bối cảnh, hãy trả lời rằng: \"Tôi không tìm thấy thông tin về vấn đề này trong tài liệu được cung cấp.\"\n"
+    "- Tuyệt đối không suy diễn hay bịa đặt thông tin.\n"
+    "- Trình bày câu trả lời rõ ràng, có thể dùng gạch đầu dòng nếu cần."
+)
 
-        prompt_template = f"""
-        Bạn là một trợ lý AI chuyên gia về Lịch sử Việt Nam giai đoạn kháng chiến chống Mỹ (1954-1975).
-        Nhiệm vụ của bạn là trả lời câu hỏi của người dùng chỉ dựa vào bối cảnh được cung cấp.
+QUIZ_JSON_SCHEMA = """[
+    {
+        "question": "Nội dung câu hỏi trắc nghiệm bằng tiếng Việt",
+        "options": {
+            "A": "Nội dung đáp án A",
+            "B": "Nội dung đáp án B",
+            "C": "Nội dung đáp án C",
+            "D": "Nội dung đáp án D"
+        },
+        "correct_answer": "A"
+    },
+    ...
+]"""
+
+QUIZ_SYSTEM_PROMPT = (
+    "Bạn là một chuyên gia tạo câu hỏi trắc nghiệm Lịch sử Việt Nam.\n"
+    "Nhiệm vụ của bạn là tạo ra chính xác số câu hỏi trắc nghiệm được yêu cầu, chỉ dựa vào bối cảnh được cung cấp.\n"
+    "\n"
+    "YÊU CẦU BẮT BUỘC:\n"
+    "1. Tạo chính xác số câu hỏi trắc nghiệm được yêu cầu.\n"
+    "2. Mỗi câu hỏi phải có 4 lựa chọn (A, B, C, D) và MỘT đáp án đúng.\n"
+    "3. Tất cả câu hỏi và đáp án phải bằng tiếng Việt.\n"
+    "4. Trả lời CHỈ bằng một MẢNG (LIST) JSON hợp lệ theo cấu trúc sau:\n"
+    + QUIZ_JSON_SCHEMA + "\n"
+    "5. KHÔNG được thêm bất kỳ văn bản, lời giải thích, hay markdown (ví dụ: ```json ... ```) nào khác vào câu trả lời. Chỉ trả về MẢNG JSON."
+)
 
-        BỐI CẢNH:
-        ---
-        {context}
-        ---
 
-        Dựa vào **CHỈ** bối cảnh trên, hãy trả lời câu hỏi sau đây một cách chi tiết, chính xác và mạch lạc.
-        - Nếu thông tin không có trong bối cảnh, hãy trả lời rằng: "Tôi không tìm thấy thông tin về vấn đề này trong tài liệu được cung cấp."
-        - Tuyệt đối không suy diễn hay bịa đặt thông tin.
-        - Trình bày câu trả lời rõ ràng, có thể dùng gạch đầu dòng nếu cần.
+class BaseRAGGenerator:
+    display_name = "LLM"
 
-        CÂU HỎI: {query}
+    def _join_context(self, context_chunks: List[RetrievedChunk]) -> str:
+        return "\n\n---\n\n".join(chunk.content for chunk in context_chunks)
 
-        CÂU TRẢ LỜI:
+    def _create_prompt_parts(self, query: str, context_chunks: List[Dict]) -> Tuple[str, str]:
         """
-        return prompt_template.strip()
-    
-# prompt cho quizz
-    def _create_quiz_prompt(self, context_chunks: List[Dict], k: int) -> str:
-        """
-        Tạo một prompt yêu cầu LLM sinh câu hỏi trắc nghiệm dưới dạng JSON.
+        Trả về (phần hệ thống cố định, phần biến đổi theo từng câu hỏi).
         """
-        context_texts = [chunk['content'] for chunk in context_chunks]
-        context = "\n\n---\n\n".join(context_texts)
+        context = self._join_context(context_chunks)
+        user_prompt = (
+            f"BỐI CẢNH:\n---\n{context}\n---\n\n"
+            f"CÂU HỎI: {query}\n\n"
+            "CÂU TRẢ LỜI:"
+        )
+        return ANSWER_SYSTEM_PROMPT, user_prompt
 
-        # Định nghĩa cấu trúc JSON mong muốn
-        json_schema = """
-        [
-            {
-                "question": "Nội dung câu hỏi trắc nghiệm bằng tiếng Việt",
-                "options": {
-                    "A": "Nội dung đáp án A",
-                    "B": "Nội dung đáp án B",
-                    "C": "Nội dung đáp án C",
-                    "D": "Nội dung đáp án D"
-                },
-                "correct_answer": "A"
-            },
-            ...
-        ]
+# prompt cho quizz
+    def _create_quiz_prompt_parts(self, context_chunks: List[Dict], k: int) -> Tuple[str, str]:
         """
-
-        prompt_template = f"""
-        Bạn là một chuyên gia tạo câu hỏi trắc nghiệm Lịch sử Việt Nam.
-        Nhiệm vụ của bạn là tạo ra chính xác {k} câu hỏi trắc nghiệm chỉ dựa vào bối cảnh được cung cấp.
-
-        BỐI CẢNH:
-        ---
-        {context}
-        ---
-
-        YÊU CẦU BẮT BUỘC:
-        1. Tạo chính xác {k} câu hỏi trắc nghiệm.
-        2. Mỗi câu hỏi phải có 4 lựa chọn (A, B, C, D) và MỘT đáp án đúng.
-        3. Tất cả câu hỏi và đáp án phải bằng tiếng Việt.
-        4. Trả lời CHỈ bằng một MẢNG (LIST) JSON hợp lệ theo cấu trúc sau:
-        {json_schema}
-        
-        5. KHÔNG được thêm bất kỳ văn bản, lời giải thích, hay markdown (ví dụ: ```json ... ```) nào khác vào câu trả lời. Chỉ trả về MẢNG JSON.
-
-        MẢNG JSON GỒM {k} CÂU HỎI:
+        Prompt sinh câu hỏi trắc nghiệm dạng JSON, tách phần chỉ dẫn cố định
+        khỏi bối cảnh và số câu hỏi k.
         """
-        return prompt_template.strip()
+        context = self._join_context(context_chunks)
+        user_prompt = (
+            f"BỐI CẢNH:\n---\n{context}\n---\n\n"
+            f"SỐ CÂU HỎI CẦN TẠO: {k}\n\n"
+            f"MẢNG JSON GỒM {k} CÂU HỎI:"
+        )
+        return QUIZ_SYSTEM_PROMPT, user_prompt
 
 
-    def _format_sources(self, context_chunks: List[Dict]) -> List[Dict]:
+    def _create_session_prompt(self, query: str, new_chunks: List[RetrievedChunk], history: List[Tuple[str, str]]) -> str:
+        """
+        Prompt cho một lượt trong phiên: lượt đầu giống _create_prompt_parts,
+        các lượt sau chỉ gửi bối cảnh mới (chunk chưa có trong lịch sử).
+        """
+        if not history:
+            return self._create_prompt_parts(query, new_chunks)[1]
+        if not new_chunks:
+            return f"CÂU HỎI: {query}\n\nCÂU TRẢ LỜI:"
+        context = self._join_context(new_chunks)
+        return (
+            f"BỐI CẢNH BỔ SUNG:\n---\n{context}\n---\n\n"
+            f"CÂU HỎI: {query}\n\n"
+            "CÂU TRẢ LỜI:"
+        )
+
+    def _format_sources(self, context_chunks: List[RetrievedChunk]) -> List[Dict]:
         return [
             {
-                "id": chunk["chunk_id"],
-                "hierarchy": chunk.get("metadata", {}).get("hierarchy_path", "N/A"),
-                "content_preview": chunk.get("content", "")[:150] + "..."
+                "id": chunk.chunk_id,
+                "hierarchy": chunk.hierarchy_path,
+                "content_preview": chunk.preview(150) + "..."
             }
             for chunk in context_chunks
         ]
@@ -134,16 +160,94 @@ class BaseRAGGenerator:
         raise NotImplementedError("Subclass phải cài đè hàm generate_answer")
     def is_ready(self) -> bool:
         raise NotImplementedError("Subclass phải cài đè hàm is_ready")
+    def _chat(self, history: List[Tuple[str, str]], prompt: str) -> str:
+        raise NotImplementedError("Subclass phải cài đè hàm _chat")
+    def _stream_quiz_text(self, system_prompt: str, prompt: str) -> Iterator[str]:
+        raise NotImplementedError("Subclass phải cài đè hàm _stream_quiz_text")
+
+    def generate_session_answer(self, query: str, context_chunks: List[RetrievedChunk],
+                                new_chunks: List[RetrievedChunk], history: List[Tuple[str, str]]) -> Dict:
+        """
+        Trả lời một lượt trong phiên chat. history là các cặp (prompt, câu trả lời)
+        đã gửi trước đó, nên chỉ new_chunks được đưa vào prompt mới; sources vẫn
+        liệt kê toàn bộ context_chunks. Kết quả có thêm "prompt" để lưu vào phiên.
+        """
+        sources_for_frontend = self._format_sources(context_chunks)
+        if not self.is_ready():
+            return {"status": "error", "answer": f"Lỗi: Model {self.display_name} chưa sẵn sàng.", "sources": sources_for_frontend}
+        prompt = self._create_session_prompt(query, new_chunks, history)
+
+        print(f"\nGửi yêu cầu (phiên, {len(history)} lượt trước, {len(new_chunks)} chunk mới) đến {self.display_name}...")
+        try:
+            answer = self._chat(history, prompt)
+        except Exception as e:
+            print(f"Lỗi khi gọi {self.display_name} (phiên): {e}")
+            return {"status": "error", "answer": f"Đã xảy ra lỗi khi gọi model {self.display_name}: {e}", "sources": sources_for_frontend}
+        print(f"{self.display_name} đã trả về câu trả lời.")
+        return {"answer": answer, "sources": sources_for_frontend, "prompt": prompt}
+
+    def generate_quiz_stream(self, context_chunks: List[Dict], k: int) -> Iterator[Dict]:
+        """
+        Yield từng câu hỏi hợp lệ ngay khi object JSON của nó đóng trong output
+        stream. Nếu model trả thiếu (hoặc có câu lỗi), chỉ yêu cầu sinh bù số
+        câu còn thiếu, tối đa QUIZ_MAX_REFILL_ROUNDS lần.
+        """
+        seen: Set[str] = set()
+        for round_idx in range(1 + QUIZ_MAX_REFILL_ROUNDS):
+            missing = k - len(seen)
+            if missing <= 0:
+                return
+            if round_idx > 0:
+                print(f"Thiếu {missing} câu hỏi hợp lệ, yêu cầu sinh bù (lần {round_idx})...")
+            system_prompt, prompt = self._create_quiz_prompt_parts(context_chunks, missing)
+            parser = QuizStreamParser()
+            for text in self._stream_quiz_text(system_prompt, prompt):
+                for question in parser.feed(text):
+                    if question["question"] in seen:
+                        continue
+                    seen.add(question["question"])
+                    yield question
+                    if len(seen) >= k:
+                        return
+            if parser.invalid:
+                print(f"Bỏ qua {parser.invalid} câu hỏi không hợp lệ.")
+
     def generate_quiz(self, context_chunks: List[Dict], k: int) -> Dict:
-        raise NotImplementedError("Subclass phải cài đè hàm generate_quiz")
+        if not self.is_ready():
+            return {"status": "error", "message": f"Lỗi: Model {self.display_name} chưa sẵn sàng."}
+
+        print(f"\nGửi yêu cầu (quiz, stream) đến {self.display_name}...")
+        questions_list: List[Dict] = []
+        try:
+            for question in self.generate_quiz_stream(context_chunks, k):
+                questions_list.append(question)
+        except Exception as e:
+            print(f"Lỗi khi gọi {self.display_name} (quiz): {e}")
+            if not questions_list:
+                return {"status": "error", "message": f"Đã xảy ra lỗi khi gọi model {self.display_name}: {e}"}
+
+        if not questions_list:
+            return {"status": "error", "message": "Lỗi: Model trả về dữ liệu không đúng định dạng JSON."}
+        # Trả về phần đã có nếu model không sinh đủ k câu
+        print(f"{self.display_name} đã trả về {len(questions_list)}/{k} câu hỏi trắc nghiệm hợp lệ.")
+        return {"status": "success", "questions": questions_list}
+
     def is_ready(self) -> bool:
         raise NotImplementedError("Subclass phải cài đè hàm is_ready")
     
 # gemini API
 class GeminiRAGGenerator(BaseRAGGenerator):
+    display_name = "Gemini"
+
     def __init__(self):
         super().__init__()
+        self.breaker = CircuitBreaker()
         try:
+            # Import muộn: chế độ chỉ truy xuất và các script không tải Gemini SDK
+            import google.generativeai as genai
+            from google.generativeai.types import HarmCategory, HarmBlockThreshold
+
+            self._genai = genai
             genai.configure(api_key=GEMINI_API_KEY)
             
             self.safety_settings = {
@@ -153,11 +257,10 @@ class GeminiRAGGenerator(BaseRAGGenerator):
                 HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
             }
             
-            self.model = genai.GenerativeModel(
-                model_name=GENERATION_MODEL_NAME,
-                safety_settings=self.safety_settings
-            )
-            
+            # Chỉ dẫn cố định đi vào system_instruction, bối cảnh + câu hỏi đi vào contents
+            self.model = self._build_model(ANSWER_SYSTEM_PROMPT)
+            self.quiz_model = self._build_model(QUIZ_SYSTEM_PROMPT)
+
             self.generation_config = {
                 "temperature": 0.1,
                 "top_p": 1,
@@ -170,21 +273,43 @@ class GeminiRAGGenerator(BaseRAGGenerator):
             print(f"lỗi khởi tạo Gemini: {e}")
             self.model = None
 
+    def _build_model(self, system_prompt: str):
+        """
+        GenerativeModel với phần chỉ dẫn cố định trong system_instruction. Không
+        dùng explicit CachedContent: chỉ dẫn chỉ vài trăm token, dưới mức tối
+        thiểu API cho phép cache.
+        """
+        return self._genai.GenerativeModel(
+            model_name=GENERATION_MODEL_NAME,
+            safety_settings=self.safety_settings,
+            system_instruction=system_prompt
+        )
+
     def is_ready(self) -> bool:
-        return self.model is not None
+        # Breaker tự chuyển sang half_open sau reset_timeout, yêu cầu kế tiếp đóng vai trò probe
+        return self.model is not None and not self.breaker.is_open()
+
+    def _generate(self, model, contents, generation_config: Dict, deadline: float, **kwargs):
+        return call_with_retry(
+            lambda timeout: model.generate_content(
+                contents,
+                generation_config=generation_config,
+                request_options={"timeout": timeout},
+                **kwargs
+            ),
+            self.breaker,
+            deadline
+        )
 
     def generate_answer(self, query: str, context_chunks: List[Dict]) -> Dict: # <<< THAY ĐỔI
         if not self.is_ready():
-            return {"answer": "Lỗi: Model Gemini chưa được khởi tạo.", "sources": []}
-        prompt = super()._create_prompt(query, context_chunks)
+            return {"status": "error", "answer": "Lỗi: Model Gemini chưa được khởi tạo.", "sources": []}
+        _, prompt = super()._create_prompt_parts(query, context_chunks)
         sources_for_frontend = super()._format_sources(context_chunks)
         
         print("\nGửi yêu cầu đến Gemini API và chờ câu trả lời...")
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=self.generation_config
-            )
+            response = self._generate(self.model, prompt, self.generation_config, LLM_ANSWER_DEADLINE)
             
             if response.parts:
                 answer = "".join(part.text for part in response.parts)
@@ -199,88 +324,73 @@ class GeminiRAGGenerator(BaseRAGGenerator):
         except Exception as e:
             print(f"Lỗi khi gọi Gemini API: {e}")
             answer = f"Đã xảy ra lỗi khi gọi Gemini API: {e}"
+            return {"status": "error", "answer": answer, "sources": sources_for_frontend}
 
         return {"answer": answer, "sources": sources_for_frontend}
     
-    def generate_quiz(self, context_chunks: List[Dict], k: int) -> Dict:
-        if not self.is_ready():
-            return {"status": "error", "message": "Lỗi: Model Gemini chưa được khởi tạo."}
-
-        prompt = super()._create_quiz_prompt(context_chunks, k)
-        
+    def _chat(self, history: List[Tuple[str, str]], prompt: str) -> str:
+        contents = []
+        for user_prompt, answer in history:
+            contents.append({"role": "user", "parts": [user_prompt]})
+            contents.append({"role": "model", "parts": [answer]})
+        contents.append({"role": "user", "parts": [prompt]})
+        response = self._generate(self.model, contents, self.generation_config, LLM_ANSWER_DEADLINE)
+        if not response.parts:
+            return f"Rất tiếc, không thể tạo câu trả lời. Lý do từ API: {response.candidates[0].finish_reason.name}"
+        return "".join(part.text for part in response.parts)
+
+    def _stream_quiz_text(self, system_prompt: str, prompt: str) -> Iterator[str]:
+        # system_prompt đã nằm trong system_instruction của quiz_model
         quiz_generation_config = {
             "temperature": 0.2, 
             "max_output_tokens": 8192,
             "response_mime_type": "application/json",
         }
-        
-        print(f"\nGửi yêu cầu (quiz) đến Gemini API (yêu cầu JSON)...")
-        try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=quiz_generation_config
-            )
-            
-            if not response.parts:
-                finish_reason = response.candidates[0].finish_reason.name
-                print(f"Gemini không trả về nội dung. Lý do: {finish_reason}")
-                return {"status": "error", "message": f"Rất tiếc, không thể tạo câu hỏi. Lý do từ API: {finish_reason}"}
-
-            json_text = "".join(part.text for part in response.parts)
-        
-            questions_list = json.loads(json_text)
-            print(f"Gemini đã trả về {len(questions_list)} câu hỏi trắc nghiệm (dạng JSON).")
-            
-            return {"status": "success", "questions": questions_list}
-
-        except json.JSONDecodeError as e:
-            print(f"Gemini không trả về JSON hợp lệ. Lỗi: {e}")
-            print(f"Nội dung trả về: {json_text[:500]}...")
-            return {"status": "error", "message": "Lỗi: Model trả về dữ liệu không đúng định dạng JSON."}
-        except Exception as e:
-            print(f"Lỗi khi gọi Gemini API (quiz): {e}")
-            return {"status": "error", "message": f"Đã xảy ra lỗi khi gọi Gemini API: {e}"}
+        response = self._generate(self.quiz_model, prompt, quiz_generation_config, LLM_QUIZ_DEADLINE, stream=True)
+        for chunk in response:
+            if chunk.parts:
+                yield "".join(part.text for part in chunk.parts)
 
 # Qwen Ollama
 class QwenOllamaGenerator(BaseRAGGenerator):
+    display_name = "Qwen (Ollama)"
+
     def __init__(self):
         super().__init__()
-        self.api_url = f"{OLLAMA_API_URL}/api/generate" # gọi api ollama
+        self.api_path = "/api/generate" # gọi api ollama
         self.model_name = OLLAMA_MODEL_NAME
-        self.session = requests.Session()
-        self._ready = False
+        self.transport = LoadBalancedTransport.from_urls(
+            OLLAMA_API_URLS,
+            default_max_concurrency=OLLAMA_MAX_CONCURRENCY
+        )
         
-        print(f"Khởi tạo Qwen (Ollama) Generator, trỏ tới: {self.api_url}")
+        print(f"Khởi tạo Qwen (Ollama) Generator, trỏ tới: {', '.join(OLLAMA_API_URLS)} ({self.api_path})")
         print(f"Model: {self.model_name}")
         
-        # Kiểm tra kết nối ngay khi khởi tạo
+        # Kiểm tra kết nối ngay khi khởi tạo; sau đó transport tự probe lại định kỳ
         if self.check_connection():
-            self._ready = True
             print("đã kết nối tới Ollama")
         else:
-            print(f"Không thể kết nối đến Ollama tại {OLLAMA_API_URL}")
+            print(f"Không thể kết nối đến Ollama tại {', '.join(OLLAMA_API_URLS)}")
 
     def check_connection(self) -> bool:
-        try:
-            response = self.session.get(OLLAMA_API_URL, timeout=3)
-            return response.status_code == 200
-        except requests.RequestException as e:
-            print(f"Lỗi kết nối Ollama: {e}")
-            return False
+        return self.transport.probe()
 
     def is_ready(self) -> bool:
-        return self._ready
+        return self.transport.is_available()
 
     def generate_answer(self, query: str, context_chunks: List[Dict]) -> Dict:
         if not self.is_ready():
-            return {"answer": "Lỗi: Model Qwen (Ollama) chưa sẵn sàng.", "sources": []}
-        prompt = super()._create_prompt(query, context_chunks)
+            return {"status": "error", "answer": "Lỗi: Model Qwen (Ollama) chưa sẵn sàng.", "sources": []}
+        system_prompt, prompt = super()._create_prompt_parts(query, context_chunks)
         sources_for_frontend = super()._format_sources(context_chunks)
 
         payload = {
             "model": self.model_name,
+            "system": system_prompt,
             "prompt": prompt,
             "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
             "options": { 
                 "temperature": 0.1,
                 "top_p": 1,
@@ -291,10 +401,7 @@ class QwenOllamaGenerator(BaseRAGGenerator):
         
         print(f"\nGửi yêu cầu đến Ollama ({self.model_name})...")
         try:
-            response = self.session.post(self.api_url, json=payload, timeout=120) 
-            response.raise_for_status()
-            
-            response_json = response.json()
+            response_json = self.transport.post_json(self.api_path, payload, deadline=LLM_ANSWER_DEADLINE)
             answer = response_json.get("response")
             
             if not answer:
@@ -302,54 +409,107 @@ class QwenOllamaGenerator(BaseRAGGenerator):
             
             print("Ollama đã trả về câu trả lời.")
 
-        except requests.Timeout:
-            print("Yêu cầu đến Ollama bị timeout.")
-            answer = "Yêu cầu đến model Qwen bị gián đoạn (timeout)."
+        except LLMUnavailableError as e:
+            print(f"Ollama không khả dụng: {e}")
+            return {"status": "error", "answer": f"Model Qwen tạm thời không khả dụng: {e}", "sources": sources_for_frontend}
         except requests.RequestException as e:
             print(f"Lỗi khi gọi Ollama API: {e}")
-            answer = f"lỗi khi gọi model: {e}"
+            return {"status": "error", "answer": f"lỗi khi gọi model: {e}", "sources": sources_for_frontend}
         
         return {"answer": answer, "sources": sources_for_frontend}
     
-    def generate_quiz(self, context_chunks: List[Dict], k: int) -> Dict:
-        if not self.is_ready():
-            return {"status": "error", "message": "Lỗi: Model Qwen (Ollama) chưa sẵn sàng."}
-
-        prompt = super()._create_quiz_prompt(context_chunks, k)
+    def _chat(self, history: List[Tuple[str, str]], prompt: str) -> str:
+        # /api/chat: prefix (system + các lượt trước) trùng với lượt trước nên Ollama dùng lại KV cache
+        messages = [{"role": "system", "content": ANSWER_SYSTEM_PROMPT}]
+        for user_prompt, answer in history:
+            messages.append({"role": "user", "content": user_prompt})
+            messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": prompt})
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {
+                "temperature": 0.1,
+                "top_p": 1,
+                "top_k": 1,
+                "num_ctx": 4096
+            }
+        }
+        response_json = self.transport.post_json("/api/chat", payload, deadline=LLM_ANSWER_DEADLINE)
+        answer = response_json.get("message", {}).get("content")
+        if not answer:
+            raise ValueError("Ollama trả về JSON nhưng không có 'message.content'.")
+        return answer
 
+    def _stream_quiz_text(self, system_prompt: str, prompt: str) -> Iterator[str]:
         payload = {
             "model": self.model_name,
+            "system": system_prompt,
             "prompt": prompt,
-            "stream": False,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
             "format": "json",
             "options": {
                 "temperature": 0.2,
                 "num_ctx": 4096
             }
         }
-        
-        print(f"\nGửi yêu cầu (quiz) đến Ollama({self.model_name}) (yêu cầu JSON)...")
-        try:
-            response = self.session.post(self.api_url, json=payload, timeout=180) # Tăng timeout
-            response.raise_for_status()
-            
-            response_json = response.json()
-            json_text = response_json.get("response")
+        for data in self.transport.post_stream(self.api_path, payload, deadline=LLM_QUIZ_DEADLINE):
+            if data.get("response"):
+                yield data["response"]
+
+
+# Failover giữa hai generator
+class FailoverGenerator(BaseRAGGenerator):
+    """
+    Gọi generator chính; nếu nó không sẵn sàng hoặc trả về lỗi thì chuyển
+    sang generator dự phòng.
+    """
+    def __init__(self, primary: BaseRAGGenerator, fallback: BaseRAGGenerator):
+        super().__init__()
+        self.primary = primary
+        self.fallback = fallback
 
-            if not json_text:
-                return {"status": "error", "message": "Lỗi: Ollama trả về JSON nhưng không có 'response'."}
-            questions_list = json.loads(json_text)
-            print(f"Ollama đã trả về {len(questions_list)} câu hỏi trắc nghiệm.")
-            
-            return {"status": "success", "questions": questions_list}
-
-        except json.JSONDecodeError as e:
-            print(f"Ollama không trả về JSON hợp lệ. Lỗi: {e}")
-            print(f"Nội dung trả về: {json_text[:500]}...")
-            return {"status": "error", "message": "dữ liệu không đúng định dạng JSON."}
-        except requests.Timeout:
-            print("Lỗi: Yêu cầu (quiz) đến Ollama bị timeout.")
-            return {"status": "error", "message": "Yêu cầu đến model Qwen bị gián đoạn (timeout)."}
-        except requests.RequestException as e:
-            print(f"Lỗi khi gọi Ollama (quiz): {e}")
-            return {"status": "error", "message": f"Đã xảy ra lỗi khi gọi model Qwen: {e}"}
\ No newline at end of file
+    def is_ready(self) -> bool:
+        return self.primary.is_ready() or self.fallback.is_ready()
+
+    def generate_answer(self, query: str, context_chunks: List[Dict]) -> Dict:
+        result = None
+        if self.primary.is_ready():
+            result = self.primary.generate_answer(query, context_chunks)
+            if result.get("status") != "error":
+                return result
+        if self.fallback.is_ready():
+            print(f"Chuyển sang generator dự phòng: {type(self.fallback).__name__}")
+            return self.fallback.generate_answer(query, context_chunks)
+        return result or self.primary.generate_answer(query, context_chunks)
+
+    def generate_session_answer(self, query: str, context_chunks: List[RetrievedChunk],
+                                new_chunks: List[RetrievedChunk], history: List[Tuple[str, str]]) -> Dict:
+        result = None
+        if self.primary.is_ready():
+            result = self.primary.generate_session_answer(query, context_chunks, new_chunks, history)
+            if result.get("status") != "error":
+                return result
+        if self.fallback.is_ready():
+            print(f"Chuyển sang generator dự phòng (phiên): {type(self.fallback).__name__}")
+            return self.fallback.generate_session_answer(query, context_chunks, new_chunks, history)
+        return result or self.primary.generate_session_answer(query, context_chunks, new_chunks, history)
+
+    def generate_quiz(self, context_chunks: List[Dict], k: int) -> Dict:
+        result = None
+        if self.primary.is_ready():
+            result = self.primary.generate_quiz(context_chunks, k)
+            if result.get("status") != "error":
+                return result
+        if self.fallback.is_ready():
+            print(f"Chuyển sang generator dự phòng (quiz): {type(self.fallback).__name__}")
+            return self.fallback.generate_quiz(context_chunks, k)
+        return result or self.primary.generate_quiz(context_chunks, k)
+
+    def generate_quiz_stream(self, context_chunks: List[Dict], k: int) -> Iterator[Dict]:
+        # Không thể chuyển model giữa chừng khi đã gửi câu hỏi cho client
+        generator = self.primary if self.primary.is_ready() else self.fallback
+        return generator.generate_quiz_stream(context_chunks, k)
@@ -0,0 +1,159 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from src.core.config import INDEX_WATCH_INTERVAL
+from .retrieval import HybridRetriever
+
+
+class _IndexHandle:
+    __slots__ = ("retriever", "version", "refs", "retired")
+
+    def __init__(self, retriever: HybridRetriever, version: str):
+        self.retriever = retriever
+        self.version = version
+        self.refs = 0
+        self.retired = False
+
+
+class IndexManager:
+    """
+    Giữ HybridRetriever đang phục vụ và cho phép thay index mới mà không
+    khởi động lại server. Index mới được build ở thread nền rồi hoán đổi
+    nguyên tử; yêu cầu đang chạy giữ tham chiếu tới index cũ (đếm tham chiếu)
+    và index cũ chỉ được giải phóng khi yêu cầu cuối cùng trả nó về.
+    """
+    def __init__(self, loader: Callable[[], HybridRetriever], version_fn: Callable[[], str],
+                 watch_interval: float = INDEX_WATCH_INTERVAL):
+        self._loader = loader
+        self._version_fn = version_fn
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        # Chỉ một lần build index mới tại một thời điểm
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.reloads = 0
+        self.last_reload_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+        version = version_fn()
+        self._current = _IndexHandle(loader(), version)
+
+    @property
+    def version(self) -> str:
+        return self._current.version
+
+    @contextmanager
+    def acquire(self) -> Iterator[HybridRetriever]:
+        """
+        Mượn retriever hiện tại cho một yêu cầu; index được giữ sống cho tới
+        khi thoát khối with dù đã bị thay trong lúc đó.
+        """
+        with self.acquire_with_version() as (retriever, _):
+            yield retriever
+
+    @contextmanager
+    def acquire_with_version(self) -> Iterator[Tuple[HybridRetriever, str]]:
+        """
+        Như `acquire` nhưng trả kèm phiên bản của chính index được mượn; đọc
+        `self.version` riêng có thể ra phiên bản của index mới nếu vừa hoán đổi.
+        """
+        with self._lock:
+            handle = self._current
+            handle.refs += 1
+        try:
+            yield handle.retriever, handle.version
+        finally:
+            self._release(handle)
+
+    def _release(self, handle: _IndexHandle):
+        with self._lock:
+            handle.refs -= 1
+            free = handle.retired and handle.refs == 0
+        if free:
+            self._free(handle)
+
+    def _free(self, handle: _IndexHandle):
+        # Bỏ tham chiếu để bộ nhớ (hoặc mmap) của index cũ được thu hồi
+        handle.retriever = None
+        print(f"Đã giải phóng index cũ (phiên bản {handle.version}).")
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Build index từ dữ liệu hiện tại và hoán đổi vào. Trả về False nếu đang
+        có lần build khác, dữ liệu chưa đổi (khi không force) hoặc build lỗi;
+        khi lỗi index cũ vẫn tiếp tục phục vụ.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            version = self._version_fn()
+            if not force and version == self.version:
+                return False
+            print(f"Đang build index mới (phiên bản {version}) ở nền...")
+            start = time.perf_counter()
+            retriever = self._loader()
+            with self._lock:
+                old = self._current
+                self._current = _IndexHandle(retriever, version)
+                old.retired = True
+                free = old.refs == 0
+            self.reloads += 1
+            self.last_reload_seconds = time.perf_counter() - start
+            self.last_error = None
+            print(f"Đã chuyển sang index mới sau {self.last_reload_seconds:.1f}s.")
+            if free:
+                self._free(old)
+            else:
+                print(f"Index cũ còn {old.refs} yêu cầu đang xử lý, sẽ giải phóng khi xong.")
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Lỗi khi nạp lại index, giữ index cũ: {e}")
+            return False
+        finally:
+            self._reload_lock.release()
+
+    def reload_async(self, force: bool = False) -> bool:
+        if self._reload_lock.locked():
+            return False
+        threading.Thread(target=self.reload, args=(force,), name="index-reload", daemon=True).start()
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "reloading": self._reload_lock.locked(),
+            "in_flight": self._current.refs,
+            "reloads": self.reloads,
+            "last_reload_seconds": self.last_reload_seconds,
+            "last_error": self.last_error,
+        }
+
+    def start(self):
+        """
+        Theo dõi phiên bản dữ liệu định kỳ và tự nạp lại khi thay đổi.
+        """
+        if self.watch_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="index-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                changed = self._version_fn() != self.version
+            except OSError as e:
+                # File đang được ghi lại / đổi tên, thử lại ở chu kỳ sau
+                print(f"Không đọc được phiên bản index: {e}")
+                continue
+            if changed:
+                self.reload()
@@ -0,0 +1,161 @@
+import json
+import mmap
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from .chunk_store import ChunkStore, TextBuffer
+
+INDEX_FORMAT_VERSION = 3
+MANIFEST_FILE = "manifest.json"
+TEXTS_FILE = "texts.bin"
+
+
+def _map_file(path: str):
+    """
+    Mmap chỉ đọc cả file; các worker mở cùng file dùng chung page cache của OS.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def file_version(path: str) -> str:
+    """
+    Phiên bản của file dữ liệu nguồn, dùng để biết index build sẵn có còn mới không.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def save_index(
+    index_dir: str,
+    store: ChunkStore,
+    embedding_matrix: np.ndarray,
+    bm25_arrays: Dict[str, np.ndarray],
+    bm25_vocab: List[str],
+    bm25_params: Dict[str, Any],
+    source_version: str = ""
+):
+    """
+    Ghi index ra thư mục dưới dạng file .npy + buffer text để các worker mmap.
+    Mỗi lần ghi tạo một thư mục phiên bản mới bên trong `index_dir`, rồi thay
+    manifest.json (con trỏ tới thư mục đó) bằng một lần os.replace nguyên tử:
+    worker luôn thấy trọn vẹn index cũ hoặc index mới, không có lúc thiếu index.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    previous = read_manifest(index_dir)
+    version_name = f"v-{time.time_ns()}-{os.getpid()}"
+    data_dir = os.path.join(index_dir, version_name)
+    os.makedirs(data_dir)
+
+    offsets = store.texts.write(os.path.join(data_dir, TEXTS_FILE))
+    np.save(os.path.join(data_dir, "text_offsets.npy"), offsets)
+    np.save(os.path.join(data_dir, "chunk_ids.npy"), store.chunk_ids)
+    np.save(os.path.join(data_dir, "metadata_ids.npy"), store.metadata_ids)
+    np.save(os.path.join(data_dir, "embeddings.npy"), np.ascontiguousarray(embedding_matrix, dtype=np.float32))
+    for name, array in bm25_arrays.items():
+        np.save(os.path.join(data_dir, f"bm25_{name}.npy"), array)
+    with open(os.path.join(data_dir, "bm25_vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(list(bm25_vocab), f, ensure_ascii=False)
+    with open(os.path.join(data_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(store.metadata_table, f, ensure_ascii=False)
+
+    manifest = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "dir": version_name,
+        "source_version": source_version,
+        "num_chunks": len(store),
+        "embedding_dim": int(embedding_matrix.shape[1]),
+        "bm25_arrays": sorted(bm25_arrays),
+        "bm25_params": bm25_params,
+    }
+    tmp_path = os.path.join(index_dir, f"{MANIFEST_FILE}.tmp-{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_FILE))
+    print(f"Đã ghi index ({len(store)} chunks) vào '{data_dir}'")
+
+    # Giữ lại phiên bản ngay trước cho worker vừa đọc con trỏ cũ và đang mở file
+    keep = {MANIFEST_FILE, version_name}
+    if previous is not None:
+        keep.add(previous["dir"])
+    _remove_stale(index_dir, keep)
+
+
+def _remove_stale(index_dir: str, keep: Set[str]):
+    """
+    Xóa các phiên bản index cũ (và file của định dạng cũ nằm thẳng trong
+    `index_dir`). Worker còn mmap file cũ vẫn đọc được trên POSIX; lỗi xóa
+    (ví dụ file đang mở trên Windows) được bỏ qua, lần ghi sau sẽ dọn tiếp.
+    """
+    for name in os.listdir(index_dir):
+        if name in keep or name.startswith(f"{MANIFEST_FILE}.tmp-"):
+            continue
+        path = os.path.join(index_dir, name)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            print(f"Không xóa được index cũ '{path}': {e}")
+
+
+def read_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def load_index(index_dir: str) -> Dict[str, Any]:
+    """
+    Mở index đã build ở chế độ chỉ đọc: mọi mảng numpy được mmap, text
+    được đọc lười từ buffer dùng chung.
+    """
+    while True:
+        manifest = read_manifest(index_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"Không tìm thấy index hợp lệ tại '{index_dir}'")
+        try:
+            # manifest.json trỏ tới thư mục phiên bản đang dùng
+            return _open_version(os.path.join(index_dir, manifest["dir"]), manifest)
+        except FileNotFoundError:
+            # Phiên bản vừa đọc đã bị dọn sau các lần ghi mới: đọc lại con trỏ
+            if read_manifest(index_dir) == manifest:
+                raise
+
+
+def _open_version(index_dir: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    def _load(name: str) -> np.ndarray:
+        return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+    with open(os.path.join(index_dir, "metadata.json"), "r", encoding="utf-8") as f:
+        metadata_table = json.load(f)
+    with open(os.path.join(index_dir, "bm25_vocab.json"), "r", encoding="utf-8") as f:
+        bm25_vocab = json.load(f)
+
+    return {
+        "manifest": manifest,
+        "store": ChunkStore(
+            _load("chunk_ids.npy"),
+            TextBuffer(_map_file(os.path.join(index_dir, TEXTS_FILE)), _load("text_offsets.npy")),
+            metadata_table,
+            _load("metadata_ids.npy")
+        ),
+        "embeddings": _load("embeddings.npy"),
+        "bm25_arrays": {name: _load(f"bm25_{name}.npy") for name in manifest["bm25_arrays"]},
+        "bm25_vocab": bm25_vocab,
+        "bm25_params": manifest["bm25_params"],
+    }
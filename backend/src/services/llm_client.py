@@ -0,0 +1,404 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.core.config import (
+    LLM_POOL_SIZE,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_BREAKER_FAILURE_THRESHOLD,
+    LLM_BREAKER_RESET_TIMEOUT,
+    LLM_HEALTH_PROBE_INTERVAL
+)
+
+T = TypeVar("T")
+
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(Exception):
+    """
+    Backend LLM không khả dụng: circuit breaker đang mở, hết deadline
+    hoặc đã hết số lần retry.
+    """
+
+
+def is_transient_error(exc: Exception) -> bool:
+    """
+    Lỗi tạm thời, đáng để retry: lỗi kết nối, timeout, HTTP 429/5xx.
+    Lỗi của Gemini SDK (google.api_core) có thuộc tính `code` là mã HTTP.
+    """
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in TRANSIENT_STATUS_CODES
+    code = getattr(exc, "code", None)
+    return isinstance(code, int) and code in TRANSIENT_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker 3 trạng thái: closed -> open (sau `failure_threshold` lỗi
+    liên tiếp) -> half_open (sau `reset_timeout` giây, cho 1 yêu cầu thử).
+    """
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = LLM_BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return self._state
+
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = "half_open"
+                self._trial_in_flight = False
+            if self._state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    print(f"Circuit breaker mở sau {self._failures} lỗi liên tiếp.")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def backoff_delay(attempt: int, end: float, base_delay: float = LLM_RETRY_BASE_DELAY,
+                  max_delay: float = LLM_RETRY_MAX_DELAY) -> float:
+    """
+    Thời gian chờ trước lần thử lại thứ attempt + 1 (full jitter), không vượt quá deadline `end`.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    return min(delay, max(0.0, end - time.monotonic()))
+
+
+def call_with_retry(
+    fn: Callable[[float], T],
+    breaker: CircuitBreaker,
+    deadline: float,
+    max_retries: int = LLM_MAX_RETRIES,
+    base_delay: float = LLM_RETRY_BASE_DELAY,
+    max_delay: float = LLM_RETRY_MAX_DELAY
+) -> T:
+    """
+    Gọi `fn(timeout_con_lai)` với retry có jitter (full jitter) cho lỗi tạm thời.
+    Tổng thời gian mọi lần thử không vượt quá `deadline` giây.
+    Lỗi không tạm thời (ví dụ HTTP 400) được ném lại nguyên vẹn.
+    """
+    end = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            raise LLMUnavailableError(f"Hết deadline {deadline:.0f}s sau {attempt} lần thử.")
+        if not breaker.allow_request():
+            raise LLMUnavailableError("Circuit breaker đang mở, tạm ngưng gọi model.")
+        try:
+            result = fn(remaining)
+        except Exception as e:
+            if not is_transient_error(e):
+                # Backend vẫn phản hồi, lỗi nằm ở yêu cầu
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt >= max_retries:
+                raise LLMUnavailableError(f"Thất bại sau {attempt + 1} lần thử: {e}") from e
+            delay = backoff_delay(attempt, end, base_delay, max_delay)
+            print(f"Lỗi tạm thời khi gọi model ({e}), thử lại sau {delay:.2f}s...")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+
+class HTTPTransport:
+    """
+    Lớp truyền tải HTTP dùng chung cho các generator: connection pool có cấu
+    hình, deadline cho từng lần gọi, retry và circuit breaker. Trạng thái sẵn
+    sàng được kiểm tra lại định kỳ qua `health_url` thay vì chỉ lúc khởi động.
+    """
+    def __init__(
+        self,
+        base_url: str,
+        health_path: str = "",
+        pool_size: int = LLM_POOL_SIZE,
+        probe_interval: float = LLM_HEALTH_PROBE_INTERVAL,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.health_url = f"{self.base_url}{health_path}"
+        self.probe_interval = probe_interval
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._healthy = False
+        self._last_probe = 0.0
+        self._probe_lock = threading.Lock()
+
+    def probe(self) -> bool:
+        """
+        Gọi health check, chỉ cập nhật trạng thái sẵn sàng. Circuit breaker
+        không bị đóng ở đây: GET / thành công chưa chắc POST thành công, nên
+        breaker vẫn chờ hết reset_timeout rồi tự đóng qua yêu cầu thử half-open.
+        """
+        self._last_probe = time.monotonic()
+        try:
+            response = self.session.get(self.health_url, timeout=3)
+            self._healthy = response.status_code == 200
+        except requests.RequestException as e:
+            print(f"Health check thất bại ({self.health_url}): {e}")
+            self._healthy = False
+        return self._healthy
+
+    def is_available(self) -> bool:
+        if (not self._healthy or self.breaker.is_open()) and \
+                time.monotonic() - self._last_probe >= self.probe_interval:
+            # Chỉ một thread probe tại một thời điểm
+            if self._probe_lock.acquire(blocking=False):
+                try:
+                    self.probe()
+                finally:
+                    self._probe_lock.release()
+        return self._healthy and not self.breaker.is_open()
+
+    def post_json(self, path: str, payload: Dict[str, Any], deadline: float,
+                  max_retries: int = LLM_MAX_RETRIES) -> Dict[str, Any]:
+        url = f"{self.base_url}{path}"
+
+        def _post(timeout: float) -> Dict[str, Any]:
+            response = self.session.post(url, json=payload, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        try:
+            return call_with_retry(_post, self.breaker, deadline, max_retries=max_retries)
+        except LLMUnavailableError:
+            if self.breaker.is_open():
+                self._healthy = False
+            raise
+
+    def post_stream(self, path: str, payload: Dict[str, Any], deadline: float,
+                    max_retries: int = LLM_MAX_RETRIES) -> Iterator[Dict[str, Any]]:
+        """
+        Gửi yêu cầu stream (NDJSON, ví dụ Ollama `stream: true`) và yield từng dòng JSON.
+        Chỉ việc mở kết nối được retry; lỗi giữa stream được ném ra cho caller.
+        """
+        url = f"{self.base_url}{path}"
+        end = time.monotonic() + deadline
+
+        def _open(timeout: float) -> requests.Response:
+            response = self.session.post(url, json=payload, timeout=timeout, stream=True)
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+            return response
+
+        try:
+            response = call_with_retry(_open, self.breaker, deadline, max_retries=max_retries)
+        except LLMUnavailableError:
+            if self.breaker.is_open():
+                self._healthy = False
+            raise
+
+        with response:
+            for line in response.iter_lines():
+                if time.monotonic() > end:
+                    raise LLMUnavailableError(f"Hết deadline {deadline:.0f}s khi đang nhận stream.")
+                if line:
+                    yield json.loads(line)
+
+
+class LoadBalancedTransport:
+    """
+    Phân phối yêu cầu tới nhiều backend (ví dụ nhiều Ollama host) theo chiến
+    lược least-outstanding-requests. Backend có circuit breaker mở hoặc health
+    check thất bại bị loại khỏi vòng chọn cho tới khi probe lại thành công.
+    Mỗi backend có thể có giới hạn số yêu cầu đồng thời (0 = không giới hạn).
+    Gặp lỗi tạm thời thì chuyển ngay sang backend khác; chỉ khi mọi backend
+    khả dụng đều đã lỗi mới chờ backoff (full jitter) rồi thử lại cả pool, tối
+    đa `max_retries` vòng trong cùng deadline.
+    """
+    def __init__(self, backends: List[HTTPTransport], max_concurrency: Optional[List[int]] = None,
+                 max_retries: int = LLM_MAX_RETRIES):
+        if not backends:
+            raise ValueError("Cần ít nhất một backend.")
+        self.backends = backends
+        self.max_concurrency = max_concurrency or [0] * len(backends)
+        self.max_retries = max_retries
+        self._outstanding = [0] * len(backends)
+        self._cond = threading.Condition()
+        self._waiters: Deque[object] = deque()
+        self._next = 0
+
+    @classmethod
+    def from_urls(cls, urls: List[str], default_max_concurrency: int = 0, max_retries: int = LLM_MAX_RETRIES,
+                  **transport_kwargs) -> "LoadBalancedTransport":
+        """
+        Tạo từ danh sách URL dạng "http://host:port" hoặc "http://host:port|cap".
+        """
+        backends, caps = [], []
+        for url in urls:
+            base_url, _, cap = url.partition("|")
+            backends.append(HTTPTransport(base_url.strip(), **transport_kwargs))
+            caps.append(int(cap) if cap.strip() else default_max_concurrency)
+        return cls(backends, caps, max_retries=max_retries)
+
+    @property
+    def outstanding(self) -> List[int]:
+        with self._cond:
+            return list(self._outstanding)
+
+    def probe(self) -> bool:
+        results = [backend.probe() for backend in self.backends]
+        return any(results)
+
+    def is_available(self) -> bool:
+        return any(backend.is_available() for backend in self.backends)
+
+    def _has_capacity(self, idx: int) -> bool:
+        cap = self.max_concurrency[idx]
+        return cap <= 0 or self._outstanding[idx] < cap
+
+    def _acquire(self, exclude: Set[int], end: float) -> int:
+        """
+        Chọn backend khả dụng có ít yêu cầu đang xử lý nhất; nếu mọi backend
+        khả dụng đều đã đạt giới hạn đồng thời thì chờ tới khi có chỗ trống.
+        """
+        # Hàng đợi FIFO: yêu cầu đến sau không được vượt yêu cầu đang chờ
+        ticket = object()
+        with self._cond:
+            self._waiters.append(ticket)
+        try:
+            while True:
+                # Kiểm tra khả dụng ngoài lock vì có thể phải probe qua mạng
+                available = [i for i, backend in enumerate(self.backends)
+                             if i not in exclude and backend.is_available()]
+                if not available:
+                    raise LLMUnavailableError("Không còn backend nào khả dụng.")
+                with self._cond:
+                    free = [i for i in available if self._has_capacity(i)]
+                    if free and self._waiters[0] is ticket:
+                        # Hòa số yêu cầu thì xoay vòng để không dồn vào backend đầu danh sách
+                        n = len(self.backends)
+                        idx = min(free, key=lambda i: (self._outstanding[i], (i - self._next) % n))
+                        self._next = (idx + 1) % n
+                        self._outstanding[idx] += 1
+                        return idx
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMUnavailableError("Hết deadline khi chờ backend còn chỗ trống.")
+                    self._cond.wait(timeout=min(remaining, 1.0))
+        finally:
+            with self._cond:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+    def _release(self, idx: int):
+        with self._cond:
+            self._outstanding[idx] -= 1
+            self._cond.notify_all()
+
+    def _attempts(self, end: float, errors: List[Exception]) -> Iterator[int]:
+        """
+        Yield lần lượt backend để thử (đã được _acquire, caller phải _release),
+        mỗi vòng mỗi backend khả dụng một lần. Hết vòng mà vẫn lỗi thì chờ
+        backoff rồi bắt đầu vòng mới; hết lượt retry, hết deadline hoặc không
+        còn backend khả dụng thì ném lỗi cuối cùng mà caller ghi vào `errors`.
+        """
+        tried: Set[int] = set()
+        attempt = 0
+        while True:
+            try:
+                idx = self._acquire(tried, end)
+            except LLMUnavailableError:
+                if not errors:
+                    raise
+                if not tried or attempt >= self.max_retries or time.monotonic() >= end:
+                    raise errors[-1]
+                delay = backoff_delay(attempt, end)
+                print(f"Mọi backend đều lỗi, thử lại cả pool sau {delay:.2f}s...")
+                time.sleep(delay)
+                attempt += 1
+                tried.clear()
+                continue
+            tried.add(idx)
+            yield idx
+
+    def post_json(self, path: str, payload: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+        end = time.monotonic() + deadline
+        errors: List[Exception] = []
+        for idx in self._attempts(end, errors):
+            try:
+                # Không retry trên cùng host: lỗi là chuyển host, retry tính cho cả pool
+                return self.backends[idx].post_json(path, payload, deadline=end - time.monotonic(),
+                                                    max_retries=0)
+            except LLMUnavailableError as e:
+                print(f"Backend {self.backends[idx].base_url} lỗi, thử backend khác: {e}")
+                errors.append(e)
+            finally:
+                self._release(idx)
+        raise LLMUnavailableError("Không còn backend nào khả dụng.")
+
+    def post_stream(self, path: str, payload: Dict[str, Any], deadline: float) -> Iterator[Dict[str, Any]]:
+        """
+        Như `post_json` nhưng stream; chỉ chuyển backend khi chưa nhận được dòng nào.
+        """
+        end = time.monotonic() + deadline
+        errors: List[Exception] = []
+        for idx in self._attempts(end, errors):
+            started = False
+            try:
+                for data in self.backends[idx].post_stream(path, payload, deadline=end - time.monotonic(),
+                                                           max_retries=0):
+                    started = True
+                    yield data
+                return
+            except LLMUnavailableError as e:
+                if started:
+                    raise
+                print(f"Backend {self.backends[idx].base_url} lỗi, thử backend khác: {e}")
+                errors.append(e)
+            finally:
+                self._release(idx)
+        raise LLMUnavailableError("Không còn backend nào khả dụng.")
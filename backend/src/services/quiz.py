@@ -0,0 +1,235 @@
+import json
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from src.core.config import (
+    QUIZ_POOL_SIZE,
+    QUIZ_POOL_BATCH_SIZE,
+    QUIZ_POOL_REFILL_INTERVAL
+)
+from .singleflight import normalize_query
+
+QUIZ_OPTION_KEYS = ("A", "B", "C", "D")
+
+
+class QuizOptions(BaseModel):
+    A: str = Field(min_length=1)
+    B: str = Field(min_length=1)
+    C: str = Field(min_length=1)
+    D: str = Field(min_length=1)
+
+
+class QuizQuestion(BaseModel):
+    question: str = Field(min_length=1)
+    options: QuizOptions
+    correct_answer: Literal["A", "B", "C", "D"]
+
+
+def validate_quiz_question(item: Any) -> Optional[Dict]:
+    """
+    Kiểm tra một câu hỏi theo schema QuizQuestion (4 lựa chọn A-D không rỗng,
+    đáp án đúng thuộc A-D). Trả về dict đã chuẩn hóa hoặc None nếu không hợp lệ.
+    """
+    if not isinstance(item, dict):
+        return None
+    if isinstance(item.get("correct_answer"), str):
+        # Model hay trả "b" hoặc " B"
+        item = {**item, "correct_answer": item["correct_answer"].strip().upper()}
+    try:
+        return QuizQuestion.model_validate(item).model_dump()
+    except ValidationError:
+        return None
+
+
+def is_valid_quiz_question(item: Any) -> bool:
+    return validate_quiz_question(item) is not None
+
+
+class QuizStreamParser:
+    """
+    Parser JSON tăng dần cho output stream của LLM. Mỗi lần `feed` nhận thêm
+    một đoạn text và trả về các câu hỏi hợp lệ có object JSON vừa đóng, không
+    cần chờ cả mảng. Chấp nhận cả mảng trần lẫn object bọc ngoài
+    ({"questions": [...]}); object lỗi chỉ bị bỏ qua riêng lẻ.
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._starts: List[int] = []
+        self._in_string = False
+        self._escape = False
+        self.invalid = 0
+
+    def feed(self, text: str) -> List[Dict]:
+        self._buffer += text
+        questions = []
+        for i in range(self._pos, len(self._buffer)):
+            ch = self._buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._starts.append(i)
+            elif ch == "}" and self._starts:
+                start = self._starts.pop()
+                question = self._parse_object(self._buffer[start:i + 1])
+                if question is not None:
+                    questions.append(question)
+        self._pos = len(self._buffer)
+        if not self._starts:
+            # Không còn object nào đang mở, bỏ phần đã xử lý
+            self._buffer, self._pos = "", 0
+        return questions
+
+    def _parse_object(self, text: str) -> Optional[Dict]:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            if '"question"' in text:
+                self.invalid += 1
+            return None
+        if not isinstance(item, dict) or "question" not in item:
+            # Object con (options) hoặc object bọc ngoài
+            return None
+        question = validate_quiz_question(item)
+        if question is None:
+            self.invalid += 1
+        return question
+
+
+class QuizPool:
+    """
+    Pool câu hỏi trắc nghiệm sinh sẵn theo (chủ đề, model). Một thread nền
+    nạp lại pool tới `size` câu; yêu cầu được phục vụ ngay từ pool nếu đủ câu.
+    Khi phiên bản corpus thay đổi, toàn bộ câu hỏi cũ bị loại bỏ.
+
+    `producer(topic, model, k)` sinh và trả về list câu hỏi (có thể ít hơn k).
+    """
+    def __init__(
+        self,
+        producer: Callable[[str, str, int], List[Dict]],
+        version_fn: Callable[[], str],
+        topics: List[str],
+        models: List[str],
+        size: int = QUIZ_POOL_SIZE,
+        batch_size: int = QUIZ_POOL_BATCH_SIZE,
+        refill_interval: float = QUIZ_POOL_REFILL_INTERVAL
+    ):
+        self.producer = producer
+        self.version_fn = version_fn
+        self.size = size
+        self.batch_size = batch_size
+        self.refill_interval = refill_interval
+        self._keys: List[Tuple[str, str]] = [(self._topic_key(t), m) for t in topics for m in models]
+        # Chủ đề gốc (chưa chuẩn hóa) để truyền cho producer; chủ đề trùng sau chuẩn hóa giữ bản đầu
+        self._topics: Dict[str, str] = {}
+        for topic in topics:
+            self._topics.setdefault(self._topic_key(topic), topic or "")
+        self._pools: Dict[Tuple[str, str], Deque[Dict]] = {key: deque() for key in self._keys}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._version = version_fn()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _topic_key(topic: Optional[str]) -> str:
+        return normalize_query(topic) if topic else ""
+
+    def start(self):
+        if self.size <= 0 or not self._keys or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="quiz-pool", daemon=True)
+        self._thread.start()
+        print(f"Quiz pool: {len(self._keys)} (chủ đề, model), {self.size} câu mỗi pool.")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def take(self, topic: Optional[str], model: str, k: int) -> Optional[List[Dict]]:
+        """
+        Lấy k câu hỏi từ pool; trả về None nếu chủ đề không được pool hoặc không đủ câu.
+        """
+        key = (self._topic_key(topic), model)
+        self._check_version()
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                return None
+            if len(pool) < k:
+                self.misses += 1
+                result = None
+            else:
+                self.hits += 1
+                result = [pool.popleft() for _ in range(k)]
+        # Báo thread nền nạp lại
+        self._wake.set()
+        return result
+
+    def _check_version(self) -> bool:
+        version = self.version_fn()
+        if version == self._version:
+            return False
+        with self._lock:
+            self._version = version
+            for pool in self._pools.values():
+                pool.clear()
+        print(f"Corpus đổi phiên bản ({version}), xóa quiz pool.")
+        return True
+
+    def _refill(self, key: Tuple[str, str]):
+        topic_key, model = key
+        topic = self._topics[topic_key]
+        while not self._stop.is_set():
+            with self._lock:
+                missing = self.size - len(self._pools[key])
+                version = self._version
+            if missing <= 0:
+                return
+            try:
+                questions = self.producer(topic, model, min(self.batch_size, missing))
+            except Exception as e:
+                print(f"Lỗi khi sinh quiz nền cho ({topic!r}, {model}): {e}")
+                return
+            valid = [q for q in questions if is_valid_quiz_question(q)]
+            if not valid:
+                return
+            with self._lock:
+                # Bỏ kết quả sinh từ corpus cũ
+                if version != self._version:
+                    continue
+                pool = self._pools[key]
+                # Bỏ câu trùng (theo nội dung câu hỏi) với pool hiện tại và trong cùng lô
+                seen = {normalize_query(q["question"]) for q in pool}
+                fresh = []
+                for question in valid:
+                    text = normalize_query(question["question"])
+                    if text not in seen:
+                        seen.add(text)
+                        fresh.append(question)
+                pool.extend(fresh[:self.size - len(pool)])
+            if not fresh:
+                # Model chỉ lặp lại câu đã có, thử lại ở vòng nạp sau
+                return
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._check_version()
+            for key in self._keys:
+                if self._stop.is_set():
+                    break
+                self._refill(key)
+            self._wake.wait(timeout=self.refill_interval)
+            self._wake.clear()
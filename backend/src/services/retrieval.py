@@ -1,57 +1,144 @@
 import numpy as np
-import pickle
 import re
-import math
-import os
-import json
-from typing import List, Dict, Any, Literal
-from dataclasses import dataclass, asdict
+import unicodedata
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from collections import Counter
-import tiktoken
-from sentence_transformers import SentenceTransformer
-from .chunking import Chunk
+# Chỉ là class dữ liệu / wrapper; sentence_transformers chỉ được tải khi khởi tạo EmbeddingPipeline
 from .embedding import EmbeddingPipeline, EmbeddedChunk
+from .index_store import load_index, save_index
+from .chunk_store import ChunkStore, RetrievedChunk
+from src.core.config import (
+    RETRIEVAL_CANDIDATE_K,
+    RETRIEVAL_MAX_CANDIDATE_K,
+    RETRIEVAL_CONFIDENT_MARGIN,
+    RETRIEVAL_MIN_AGREEMENT,
+    RETRIEVAL_FLAT_SPREAD,
+    RETRIEVAL_LATENCY_BUDGET_MS
+)
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_DATE_RE = re.compile(r'\d{1,2}[-/]\d{1,2}[-/]\d{4}|\d{4}')
+# Dấu câu ngắt cụm từ: không ghép bigram qua dấu phẩy, chấm, ngoặc...
+_PHRASE_BREAK_RE = re.compile(r'[^\w\s]+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    NFC + chữ thường: gõ tiếng Việt kiểu tổ hợp (NFD) vẫn khớp với corpus (NFC).
+    """
+    return unicodedata.normalize("NFC", text).lower()
+
+
+def tokenize_vietnamese(text: str, bigrams: bool = False) -> List[str]:
+    """
+    Tách âm tiết tiếng Việt bằng một lượt regex đã biên dịch sẵn. Ngày tháng
+    ("20/7/1954") và số vẫn tách thành các token số riêng như trước.
+    Với `bigrams=True`, thêm token ghép hai âm tiết liền kề trong cùng cụm
+    ("hồ chí", "chí minh") để tên riêng nhiều âm tiết được chấm điểm như một đơn vị.
+    """
+    text = normalize_text(text)
+    if not bigrams:
+        return _WORD_RE.findall(text)
+    tokens = []
+    for segment in _PHRASE_BREAK_RE.split(text):
+        words = _WORD_RE.findall(segment)
+        tokens.extend(words)
+        # Khoảng trắng trong token ghép nên không bao giờ trùng với âm tiết đơn
+        tokens.extend(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return tokens
+
+
 # BM25 CLASS
 class BM25:
     """
-    BM25 algorithm cho keyword-based retrieval
+    BM25 algorithm cho keyword-based retrieval.
+    Index lưu dạng postings CSR (term -> danh sách (doc, tf)) trong mảng numpy
+    để chấm điểm vector hóa và có thể mmap dùng chung giữa các worker.
     """
-    def __init__(self, k1: float = 1.5, b: float = 0.75):
+    def __init__(self, k1: float = 1.5, b: float = 0.75, bigrams: bool = False):
         self.k1, self.b = k1, b
+        self.bigrams = bigrams
         self.corpus_size, self.avgdl = 0, 0
-        self.doc_freqs, self.idf, self.doc_len, self.documents = [], {}, [], []
+        self.vocab: Dict[str, int] = {}
+        self.idf = np.zeros(0)
+        self.doc_len = np.zeros(0)
+        self.postings_ptr = np.zeros(1, dtype=np.int64)
+        self.postings_doc = np.zeros(0, dtype=np.int32)
+        self.postings_tf = np.zeros(0, dtype=np.float32)
 
     def _tokenize_vietnamese(self, text: str) -> List[str]:
-        text = text.lower()
-        text = re.sub(r'(\d{1,2}[-/]\d{1,2}[-/]\d{4})', r' \1 ', text)
-        text = re.sub(r'\b(\d+)\b', r' \1 ', text)
-        return re.findall(r'\w+', text, re.UNICODE)
+        return tokenize_vietnamese(text, bigrams=self.bigrams)
 
     def fit(self, corpus: List[str]):
         self.corpus_size = len(corpus)
-        self.documents = corpus
         tokenized_corpus = [self._tokenize_vietnamese(doc) for doc in corpus]
-        self.doc_len = [len(doc) for doc in tokenized_corpus]
-        self.avgdl = sum(self.doc_len) / self.corpus_size
-        df = {}
-        for document in tokenized_corpus:
-            for term in set(document):
-                df[term] = df.get(term, 0) + 1
-        for term, freq in df.items():
-            self.idf[term] = math.log((self.corpus_size - freq + 0.5) / (freq + 0.5) + 1)
-        self.doc_freqs = [Counter(doc) for doc in tokenized_corpus]
+        self.doc_len = np.array([len(doc) for doc in tokenized_corpus], dtype=np.float64)
+        self.avgdl = float(self.doc_len.sum()) / self.corpus_size
+
+        term_postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, document in enumerate(tokenized_corpus):
+            for term, tf in Counter(document).items():
+                term_postings.setdefault(term, []).append((doc_id, tf))
+
+        self.vocab = {term: term_id for term_id, term in enumerate(term_postings)}
+        ptr = np.zeros(len(term_postings) + 1, dtype=np.int64)
+        docs, tfs = [], []
+        for term_id, postings in enumerate(term_postings.values()):
+            ptr[term_id + 1] = ptr[term_id] + len(postings)
+            docs.extend(doc_id for doc_id, _ in postings)
+            tfs.extend(tf for _, tf in postings)
+        self.postings_ptr = ptr
+        self.postings_doc = np.array(docs, dtype=np.int32)
+        self.postings_tf = np.array(tfs, dtype=np.float32)
+        df = np.diff(ptr).astype(np.float64)
+        self.idf = np.log((self.corpus_size - df + 0.5) / (df + 0.5) + 1)
+
+    def to_arrays(self) -> Tuple[Dict[str, np.ndarray], List[str], Dict[str, Any]]:
+        arrays = {
+            "doc_len": self.doc_len, "idf": self.idf, "postings_ptr": self.postings_ptr,
+            "postings_doc": self.postings_doc, "postings_tf": self.postings_tf,
+        }
+        params = {"k1": self.k1, "b": self.b, "bigrams": self.bigrams,
+                  "corpus_size": self.corpus_size, "avgdl": self.avgdl}
+        return arrays, list(self.vocab), params
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], vocab: List[str], params: Dict[str, Any]) -> "BM25":
+        bm25 = cls(k1=params["k1"], b=params["b"], bigrams=params.get("bigrams", False))
+        bm25.corpus_size, bm25.avgdl = params["corpus_size"], params["avgdl"]
+        bm25.vocab = {term: term_id for term_id, term in enumerate(vocab)}
+        for name, array in arrays.items():
+            setattr(bm25, name, array)
+        return bm25
+
+    def count_matching_terms(self, terms: Iterable[str], docs: np.ndarray) -> np.ndarray:
+        """
+        Với mỗi doc trong `docs`, đếm số term (không trùng) của `terms` có trong doc,
+        tra trực tiếp trên postings (đã sắp theo doc id) thay vì tách từ lại nội dung.
+        """
+        counts = np.zeros(len(docs), dtype=np.int32)
+        for term in set(terms):
+            term_id = self.vocab.get(term)
+            if term_id is None: continue
+            postings = self.postings_doc[self.postings_ptr[term_id]:self.postings_ptr[term_id + 1]]
+            pos = np.minimum(np.searchsorted(postings, docs), len(postings) - 1)
+            counts += postings[pos] == docs
+        return counts
 
     def get_scores(self, query: str) -> np.ndarray:
         query_tokens = self._tokenize_vietnamese(query)
         scores = np.zeros(self.corpus_size)
         for token in query_tokens:
-            if token not in self.idf: continue
-            idf = self.idf[token]
-            for idx, doc_tf in enumerate(self.doc_freqs):
-                tf = doc_tf.get(token, 0)
-                numerator = tf * (self.k1 + 1)
-                denominator = tf + self.k1 * (1 - self.b + self.b * (self.doc_len[idx] / self.avgdl))
-                scores[idx] += idf * (numerator / denominator)
+            term_id = self.vocab.get(token)
+            if term_id is None: continue
+            start, end = self.postings_ptr[term_id], self.postings_ptr[term_id + 1]
+            docs = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end].astype(np.float64)
+            numerator = tf * (self.k1 + 1)
+            denominator = tf + self.k1 * (1 - self.b + self.b * (self.doc_len[docs] / self.avgdl))
+            scores[docs] += self.idf[term_id] * (numerator / denominator)
         return scores
 
 # HYBRID RETRIEVER
@@ -59,69 +146,272 @@ class HybridRetriever:
     """
     Hybrid Retriever kết hợp Semantic + Keyword search
     """
-    def __init__(self, embedded_chunks: List[EmbeddedChunk], embedding_pipeline: EmbeddingPipeline, semantic_weight: float = 0.5, keyword_weight: float = 0.5):
-        self.embedded_chunks = embedded_chunks
+    def __init__(self, embedded_chunks: List[EmbeddedChunk], embedding_pipeline: EmbeddingPipeline, semantic_weight: float = 0.5, keyword_weight: float = 0.5, bm25_bigrams: bool = False):
         self.pipeline = embedding_pipeline
         self.semantic_weight = semantic_weight
         self.keyword_weight = keyword_weight
+
+        self.store = ChunkStore.from_columns(
+            [ec.chunk_id for ec in embedded_chunks],
+            (ec.content for ec in embedded_chunks),
+            (ec.metadata for ec in embedded_chunks)
+        )
         
         self.embedding_matrix = np.vstack([ec.embedding for ec in embedded_chunks])
         self.embedding_matrix /= np.linalg.norm(self.embedding_matrix, axis=1, keepdims=True)
         
         print("Đang build BM25 index...")
-        self.bm25 = BM25()
+        self.bm25 = BM25(bigrams=bm25_bigrams)
         self.bm25.fit([ec.content for ec in embedded_chunks])
         print("BM25 index ready!")
 
+    @classmethod
+    def from_index_dir(cls, index_dir: str, embedding_pipeline: EmbeddingPipeline, semantic_weight: float = 0.5, keyword_weight: float = 0.5) -> "HybridRetriever":
+        """
+        Gắn vào index đã build sẵn bởi tiến trình cha (xem scripts/serve.py).
+        Vector, postings BM25 và text được mmap chỉ đọc nên nhiều worker dùng
+        chung một bản trong page cache thay vì mỗi worker giữ một bản riêng.
+        """
+        index = load_index(index_dir)
+        retriever = cls.__new__(cls)
+        retriever.pipeline = embedding_pipeline
+        retriever.semantic_weight = semantic_weight
+        retriever.keyword_weight = keyword_weight
+        retriever.store = index["store"]
+        retriever.embedding_matrix = index["embeddings"]
+        retriever.bm25 = BM25.from_arrays(index["bm25_arrays"], index["bm25_vocab"], index["bm25_params"])
+        print(f"Đã gắn index dùng chung ({len(retriever.store)} chunks) từ '{index_dir}'")
+        return retriever
+
+    def save_index(self, index_dir: str, source_version: str = ""):
+        bm25_arrays, bm25_vocab, bm25_params = self.bm25.to_arrays()
+        save_index(
+            index_dir,
+            store=self.store,
+            embedding_matrix=self.embedding_matrix,
+            bm25_arrays=bm25_arrays,
+            bm25_vocab=bm25_vocab,
+            bm25_params=bm25_params,
+            source_version=source_version
+        )
+
     def _normalize_scores(self, scores: np.ndarray) -> np.ndarray:
-        if scores.max() == scores.min(): return np.zeros_like(scores)
-        return (scores - scores.min()) / (scores.max() - scores.min())
+        min_score, max_score = scores.min(), scores.max()
+        if max_score == min_score: return np.zeros_like(scores)
+        normalized = scores - min_score
+        normalized /= (max_score - min_score)
+        return normalized
 
-    def retrieve(self, query: str, top_k: int = 5, return_details: bool = False) -> List[Dict[str, Any]]:
+    def embed_query(self, query: str) -> np.ndarray:
         query_embedding = self.pipeline.embed_text(query, is_query=True)
         query_embedding /= np.linalg.norm(query_embedding)
+        return query_embedding
+
+    def _score_all(self, query: str, query_embedding: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Điểm semantic, BM25 và điểm kết hợp (đã chuẩn hóa) cho toàn bộ corpus.
+        query_embedding: vector câu hỏi đã tính sẵn (vd. khi embed theo lô).
+        """
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        else:
+            query_embedding = query_embedding / np.linalg.norm(query_embedding)
         semantic_scores = np.dot(self.embedding_matrix, query_embedding)
         keyword_scores = self.bm25.get_scores(query)
         
-        semantic_scores_norm = self._normalize_scores(semantic_scores)
+        # Tính combined tại chỗ để giảm mảng tạm trên mỗi request
+        combined_scores = self._normalize_scores(semantic_scores)
+        combined_scores *= self.semantic_weight
         keyword_scores_norm = self._normalize_scores(keyword_scores)
-        
-        combined_scores = (self.semantic_weight * semantic_scores_norm + self.keyword_weight * keyword_scores_norm)
-        top_indices = np.argsort(combined_scores)[::-1][:top_k]
-        
-        results = []
-        for rank, idx in enumerate(top_indices, 1):
-            result = {
-                "rank": rank, "chunk_id": self.embedded_chunks[idx].chunk_id,
-                "content": self.embedded_chunks[idx].content, "metadata": self.embedded_chunks[idx].metadata,
-                "combined_score": float(combined_scores[idx])
-            }
-            if return_details:
-                result.update({
-                    "semantic_score": float(semantic_scores[idx]),
-                    "keyword_score": float(keyword_scores[idx])
-                })
-            results.append(result)
-        return results
+        keyword_scores_norm *= self.keyword_weight
+        combined_scores += keyword_scores_norm
+        del keyword_scores_norm
+        return semantic_scores, keyword_scores, combined_scores
+
+    @staticmethod
+    def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+        # Chỉ sắp xếp k phần tử thay vì toàn bộ corpus
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top_indices = np.argpartition(-scores, k - 1)[:k]
+        return top_indices[np.argsort(-scores[top_indices])]
 
-    def _compute_rerank_score(self, query: str, candidate: Dict) -> float:
-        content, query_lower = candidate["content"].lower(), query.lower()
+    def _make_chunks(self, top_indices: np.ndarray, combined_scores: np.ndarray,
+                     semantic_scores: Optional[np.ndarray] = None, keyword_scores: Optional[np.ndarray] = None) -> List[RetrievedChunk]:
+        return [
+            RetrievedChunk(
+                self.store, int(idx), rank, float(combined_scores[idx]),
+                semantic_score=float(semantic_scores[idx]) if semantic_scores is not None else None,
+                keyword_score=float(keyword_scores[idx]) if keyword_scores is not None else None
+            )
+            for rank, idx in enumerate(top_indices, 1)
+        ]
+
+    def retrieve(self, query: str, top_k: int = 5, return_details: bool = False,
+                 query_embedding: Optional[np.ndarray] = None) -> List[RetrievedChunk]:
+        """
+        Trả về các RetrievedChunk (chỉ vị trí + điểm số); nội dung chỉ được
+        đọc từ ChunkStore khi cần.
+        """
+        semantic_scores, keyword_scores, combined_scores = self._score_all(query, query_embedding)
+        top_indices = self._top_indices(combined_scores, top_k)
+        if return_details:
+            return self._make_chunks(top_indices, combined_scores, semantic_scores, keyword_scores)
+        return self._make_chunks(top_indices, combined_scores)
+
+    def _compute_rerank_score(self, query_lower: str, candidate: RetrievedChunk, coverage: float, query_dates: List[bytes], has_words: bool) -> float:
         score = 0.0
-        if query_lower in content: score += 0.3
+        # Cả câu truy vấn chỉ xuất hiện nguyên văn khi mọi từ của nó có trong chunk,
+        # nên chỉ decode nội dung chunk trong trường hợp đó
+        if (coverage >= 1.0 or not has_words) and query_lower in candidate.content.lower(): score += 0.3
         
-        query_words = set(re.findall(r'\w+', query_lower, re.UNICODE))
-        coverage = len(query_words & set(re.findall(r'\w+', content, re.UNICODE))) / len(query_words) if query_words else 0
         score += 0.3 * coverage
         
-        query_dates = re.findall(r'\d{1,2}[-/]\d{1,2}[-/]\d{4}|\d{4}', query_lower)
-        if query_dates and any(date in content for date in query_dates): score += 0.4
+        if query_dates and any(self.store.texts.contains(candidate.index, date) for date in query_dates): score += 0.4
         return min(score, 1.0)
         
-    def retrieve_with_rerank(self, query: str, top_k: int = 5, candidate_k: int = 20) -> List[Dict[str, Any]]:
-        candidates = self.retrieve(query, top_k=candidate_k, return_details=True)
-        for cand in candidates:
-            rerank_score = self._compute_rerank_score(query, cand)
-            cand["rerank_score"] = rerank_score
-            cand["final_score"] = 0.6 * cand["combined_score"] + 0.4 * cand["rerank_score"]
-        candidates.sort(key=lambda x: x["final_score"], reverse=True)
-        return candidates[:top_k]
\ No newline at end of file
+    def retrieve_with_rerank(self, query: str, top_k: int = 5, candidate_k: int = 20,
+                             query_embedding: Optional[np.ndarray] = None) -> List[RetrievedChunk]:
+        candidates = self.retrieve(query, top_k=candidate_k, return_details=True, query_embedding=query_embedding)
+        return self._rerank(query, candidates, top_k)
+
+    def rerank_chunk_ids(self, query: str, chunk_ids: Iterable[int], top_k: int = 5,
+                         query_embedding: Optional[np.ndarray] = None) -> List[RetrievedChunk]:
+        """
+        Chấm lại một tập nhỏ chunk đã biết (vd. chunk của các lượt chat trước)
+        mà không quét cả corpus: cosine với câu hỏi rồi rerank như thường.
+        semantic_score của kết quả là cosine thô để người gọi so với ngưỡng.
+        """
+        indices = [idx for idx in (self.store.position(chunk_id) for chunk_id in chunk_ids) if idx is not None]
+        if not indices:
+            return []
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        else:
+            query_embedding = query_embedding / np.linalg.norm(query_embedding)
+        indices = np.asarray(indices, dtype=np.int64)
+        similarities = np.dot(self.embedding_matrix[indices], query_embedding)
+        candidates = [
+            RetrievedChunk(self.store, int(idx), rank, float(similarity), semantic_score=float(similarity))
+            for rank, (idx, similarity) in enumerate(zip(indices, similarities), 1)
+        ]
+        return self._rerank(query, candidates, top_k)
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 5, candidate_k: int = 20,
+                       batch_size: int = 32) -> Tuple[List[List[RetrievedChunk]], np.ndarray]:
+        """
+        Truy xuất cho nhiều câu hỏi: embed cả lô một lần rồi chấm điểm từng câu.
+        Trả về (kết quả theo thứ tự queries, embedding câu hỏi đã chuẩn hóa).
+        """
+        if not queries:
+            return [], np.empty((0, self.embedding_matrix.shape[1]), dtype=np.float32)
+        embeddings = np.asarray(self.pipeline.embed_batch(queries, batch_size=batch_size, show_progress=False), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        results = [
+            self.retrieve_with_rerank(query, top_k=top_k, candidate_k=candidate_k, query_embedding=embedding)
+            for query, embedding in zip(queries, embeddings)
+        ]
+        return results, embeddings
+
+    def _rerank(self, query: str, candidates: List[RetrievedChunk], top_k: int) -> List[RetrievedChunk]:
+        if not candidates:
+            return []
+        query_lower = normalize_text(query)
+        query_words = set(_WORD_RE.findall(query_lower))
+        query_dates = [date.encode("utf-8") for date in _DATE_RE.findall(query_lower)]
+        if query_words:
+            docs = np.fromiter((cand.index for cand in candidates), dtype=np.int32, count=len(candidates))
+            coverages = self.bm25.count_matching_terms(query_words, docs) / len(query_words)
+        else:
+            coverages = np.zeros(len(candidates))
+        for cand, coverage in zip(candidates, coverages):
+            cand.rerank_score = self._compute_rerank_score(query_lower, cand, float(coverage), query_dates, bool(query_words))
+            cand.final_score = 0.6 * cand.combined_score + 0.4 * cand.rerank_score
+        candidates.sort(key=lambda x: x.final_score, reverse=True)
+        return candidates[:top_k]
+
+    def retrieve_adaptive(self, query: str, top_k: int = 5, min_top_k: Optional[int] = None,
+                          stats: Optional["RetrievalStats"] = None,
+                          query_embedding: Optional[np.ndarray] = None) -> List[RetrievedChunk]:
+        """
+        Độ sâu truy xuất theo độ chắc chắn của điểm số:
+        - "early_exit": tại điểm cắt (min_top_k nếu có, không thì top_k), chunk cuối
+          được giữ cách xa chunk đầu tiên bị bỏ và semantic/BM25 đồng thuận -> bỏ
+          rerank. Không áp dụng khi corpus không có chunk nào ngoài top_k để so sánh.
+        - "widened": điểm phẳng, khó phân biệt -> rerank trên RETRIEVAL_MAX_CANDIDATE_K ứng viên.
+        - "rerank": còn lại, rerank trên RETRIEVAL_CANDIDATE_K ứng viên như trước.
+        - "over_budget": bước chấm điểm đã vượt RETRIEVAL_LATENCY_BUDGET_MS -> bỏ rerank.
+        """
+        start = time.perf_counter()
+        semantic_scores, keyword_scores, combined_scores = self._score_all(query, query_embedding)
+        candidate_k = RETRIEVAL_CANDIDATE_K
+        wide = self._top_indices(combined_scores, max(RETRIEVAL_MAX_CANDIDATE_K, top_k + 1))
+        if len(wide) == 0:
+            return []
+
+        top = combined_scores[wide[0]]
+        # Số chunk trả về nếu early exit; margin đo tại đúng điểm cắt này
+        cut = min(min_top_k, top_k) if min_top_k else top_k
+        # Khoảng cách giữa chunk cuối cùng được giữ và chunk đầu tiên bị cắt bỏ
+        # (tỉ lệ so với điểm cao nhất): nhỏ nghĩa là điểm cắt mơ hồ, cần rerank
+        has_boundary = top_k < len(wide)
+        margin = (combined_scores[wide[cut - 1]] - combined_scores[wide[cut]]) / top \
+            if has_boundary and top > 0 else 0.0
+        # Độ trải của điểm trên tập ứng viên mặc định; nhỏ = phẳng
+        spread = top - combined_scores[wide[min(candidate_k, len(wide)) - 1]]
+        semantic_top = self._top_indices(semantic_scores, top_k)
+        keyword_top = self._top_indices(keyword_scores, top_k)
+        agreement = len(np.intersect1d(semantic_top, keyword_top)) / max(len(semantic_top), 1)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if RETRIEVAL_LATENCY_BUDGET_MS > 0 and elapsed_ms >= RETRIEVAL_LATENCY_BUDGET_MS:
+            path = "over_budget"
+        elif margin >= RETRIEVAL_CONFIDENT_MARGIN and agreement >= RETRIEVAL_MIN_AGREEMENT:
+            path = "early_exit"
+        elif spread <= RETRIEVAL_FLAT_SPREAD:
+            path = "widened"
+            candidate_k = RETRIEVAL_MAX_CANDIDATE_K
+        else:
+            path = "rerank"
+
+        if path in ("early_exit", "over_budget"):
+            k = cut if path == "early_exit" else top_k
+            results = self._make_chunks(wide[:k], combined_scores, semantic_scores, keyword_scores)
+            for chunk in results:
+                chunk.final_score = chunk.combined_score
+        else:
+            candidates = self._make_chunks(wide[:candidate_k], combined_scores, semantic_scores, keyword_scores)
+            results = self._rerank(query, candidates, top_k)
+
+        if stats is not None:
+            stats.record(path, (time.perf_counter() - start) * 1000)
+        print(f"Truy xuất thích ứng: {path} (margin={margin:.2f}, agreement={agreement:.2f}, spread={spread:.2f}, {len(results)} chunk)")
+        return results
+
+
+class RetrievalStats:
+    """
+    Đếm số lần mỗi nhánh truy xuất thích ứng được chọn và thời gian của nó.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = Counter()
+        self._total_ms: Dict[str, float] = Counter()
+
+    def record(self, path: str, elapsed_ms: float):
+        with self._lock:
+            self._counts[path] += 1
+            self._total_ms[path] += elapsed_ms
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            total = sum(self._counts.values())
+            return {
+                path: {
+                    "count": count,
+                    "ratio": round(count / total, 4),
+                    "avg_ms": round(self._total_ms[path] / count, 3)
+                }
+                for path, count in self._counts.items()
+            }
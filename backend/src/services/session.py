@@ -0,0 +1,196 @@
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from src.core.config import (
+    SESSION_TTL_SECONDS,
+    SESSION_MAX_SESSIONS,
+    SESSION_MAX_TURNS,
+    SESSION_MAX_CHARS,
+    SESSION_MAX_CHUNKS,
+    SESSION_CHUNK_DECAY
+)
+from .chunk_store import ChunkStore, RetrievedChunk
+from .singleflight import normalize_query
+
+# Mở đầu câu nối tiếp ("Sau đó thì sao?", "Còn miền Bắc?"), chỉ xét ở đầu câu
+_FOLLOWUP_OPENERS = (
+    ("sau", "đó"), ("tiếp", "theo"), ("trước", "đó"), ("thế", "còn"), ("vậy", "còn"),
+    ("còn",), ("vậy",), ("rồi",),
+)
+# Đại từ / chỉ định thay cho đối tượng ở lượt trước, xét ở bất kỳ vị trí nào
+_FOLLOWUP_REFERENCES = (
+    ("ông", "ấy"), ("bà", "ấy"), ("ông", "ta"), ("bà", "ta"), ("anh", "ấy"),
+    ("họ",), ("nó",), ("này",), ("đó",), ("ấy",),
+)
+# Câu ngắn chỉ gồm các từ này là câu tỉnh lược ("Tại sao?", "Kết quả ra sao?")
+_ELLIPTICAL_WORDS = {
+    "tại", "sao", "vì", "thì", "thế", "nào", "ra", "như", "kết", "quả", "ý", "nghĩa",
+    "là", "gì", "còn", "vậy", "rồi", "nguyên", "nhân", "diễn", "biến", "khi", "ở", "đâu", "ai",
+}
+_FOLLOWUP_MAX_WORDS = 4
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _contains_phrase(words: List[str], phrase: Tuple[str, ...]) -> bool:
+    n = len(phrase)
+    return any(tuple(words[i:i + n]) == phrase for i in range(len(words) - n + 1))
+
+
+def is_followup_query(query: str) -> bool:
+    """
+    Heuristic rẻ (không gọi LLM), so khớp theo nguyên từ: câu mở đầu bằng từ
+    nối tiếp, có đại từ/chỉ định trỏ về lượt trước, hoặc là câu tỉnh lược ngắn
+    không có từ nội dung. Câu tự đứng được ("Hiệp định Paris") không phải nối tiếp.
+    """
+    words = _WORD_RE.findall(normalize_query(query))
+    if not words:
+        return False
+    if any(tuple(words[:len(opener)]) == opener for opener in _FOLLOWUP_OPENERS):
+        return True
+    if any(_contains_phrase(words, reference) for reference in _FOLLOWUP_REFERENCES):
+        return True
+    return len(words) <= _FOLLOWUP_MAX_WORDS and all(word in _ELLIPTICAL_WORDS for word in words)
+
+
+class Turn:
+    __slots__ = ("query", "prompt", "answer", "chunk_ids")
+
+    def __init__(self, query: str, prompt: str, answer: str, chunk_ids: List[int]):
+        self.query = query
+        self.prompt = prompt
+        self.answer = answer
+        self.chunk_ids = chunk_ids
+
+    @property
+    def size(self) -> int:
+        return len(self.prompt) + len(self.answer)
+
+
+class SessionState:
+    """
+    Trạng thái một phiên chat, có giới hạn: tối đa SESSION_MAX_TURNS lượt và
+    SESSION_MAX_CHARS ký tự lịch sử, SESSION_MAX_CHUNKS chunk đã truy xuất.
+    """
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.lock = threading.Lock()
+        self.turns: Deque[Turn] = deque()
+        self.topic_query: Optional[str] = None
+        # Chỉ giữ chunk id -> điểm, không giữ RetrievedChunk (tham chiếu tới ChunkStore)
+        # để index cũ được giải phóng ngay sau khi hot-swap
+        self.chunks: "OrderedDict[int, float]" = OrderedDict()
+        self.index_version: Optional[str] = None
+        self.last_active = time.monotonic()
+
+    def rewrite(self, query: str) -> Tuple[str, bool]:
+        """
+        Trả về (câu truy vấn dùng để truy xuất, có phải câu nối tiếp không).
+        Câu nối tiếp được ghép với câu hỏi độc lập gần nhất của phiên.
+        """
+        if self.topic_query is None or not is_followup_query(query):
+            return query, False
+        return f"{self.topic_query} {query}", True
+
+    def history(self) -> List[Tuple[str, str]]:
+        return [(turn.prompt, turn.answer) for turn in self.turns]
+
+    def sent_chunk_ids(self) -> Set[int]:
+        """
+        Chunk đã nằm trong lịch sử gửi cho LLM, không cần gửi lại.
+        """
+        return {chunk_id for turn in self.turns for chunk_id in turn.chunk_ids}
+
+    def sync_index(self, version: str):
+        """
+        Sau khi index được thay, chunk id có thể trỏ tới nội dung khác: quên
+        các chunk đã nhớ và coi như chưa gửi chunk nào để lượt sau gửi lại bối cảnh.
+        """
+        if self.index_version is not None and self.index_version != version:
+            self.chunks.clear()
+            for turn in self.turns:
+                turn.chunk_ids = []
+        self.index_version = version
+
+    def merge_chunks(self, retrieved: List[RetrievedChunk], top_k: int, store: ChunkStore) -> List[RetrievedChunk]:
+        """
+        Gộp chunk mới truy xuất với chunk của các lượt trước (điểm bị giảm theo
+        SESSION_CHUNK_DECAY), giữ top_k chunk liên quan nhất cho lượt này.
+        """
+        merged: Dict[int, RetrievedChunk] = {chunk.chunk_id: chunk for chunk in retrieved}
+        for chunk_id, score in self.chunks.items():
+            index = store.position(chunk_id)
+            if chunk_id in merged or index is None:
+                continue
+            carried = RetrievedChunk(store, index, 0, score)
+            carried.final_score = score * SESSION_CHUNK_DECAY
+            merged[chunk_id] = carried
+        ranked = sorted(merged.values(), key=lambda c: c.final_score or 0.0, reverse=True)[:top_k]
+        for rank, chunk in enumerate(ranked, 1):
+            chunk.rank = rank
+        return ranked
+
+    def record_turn(self, query: str, is_followup: bool, prompt: str, answer: str, context_chunks: List[RetrievedChunk], sent_ids: List[int]):
+        if not is_followup:
+            self.topic_query = query
+        self.turns.append(Turn(query, prompt, answer, sent_ids))
+        while len(self.turns) > SESSION_MAX_TURNS or \
+                (len(self.turns) > 1 and sum(turn.size for turn in self.turns) > SESSION_MAX_CHARS):
+            self.turns.popleft()
+        for chunk in context_chunks:
+            self.chunks[chunk.chunk_id] = chunk.final_score or chunk.combined_score
+            self.chunks.move_to_end(chunk.chunk_id)
+        while len(self.chunks) > SESSION_MAX_CHUNKS:
+            self.chunks.popitem(last=False)
+        self.last_active = time.monotonic()
+
+
+class SessionStore:
+    """
+    Kho phiên trong bộ nhớ: hết hạn sau SESSION_TTL_SECONDS không hoạt động,
+    vượt SESSION_MAX_SESSIONS thì loại phiên ít dùng gần đây nhất (LRU).
+    """
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_sessions: int = SESSION_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self) -> SessionState:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            state = SessionState(uuid.uuid4().hex)
+            state.last_active = now
+            self._sessions[state.session_id] = state
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return state
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        """
+        Trả về None nếu phiên không có trong tiến trình này (đã hết hạn, bị
+        loại, hoặc được tạo ở worker khác); không tự tạo phiên mới cùng id.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            state = self._sessions.get(session_id)
+            if state is not None:
+                self._sessions.move_to_end(session_id)
+                state.last_active = now
+            return state
+
+    def _evict_expired(self, now: float):
+        # Phiên cũ nhất nằm đầu OrderedDict
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state.last_active < self.ttl:
+                break
+            del self._sessions[session_id]
@@ -0,0 +1,73 @@
+import re
+import threading
+import unicodedata
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?.!…]+$")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Chuẩn hóa câu hỏi để so khớp: NFC, chữ thường, gộp khoảng trắng,
+    bỏ dấu câu ở cuối ("Điện Biên Phủ?" == "điện biên phủ").
+    """
+    text = unicodedata.normalize("NFC", query).lower()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi đồng thời có cùng key: chỉ lời gọi đầu tiên thực thi `fn`,
+    các lời gọi đến sau trong lúc nó đang chạy chờ và nhận cùng kết quả
+    (hoặc cùng exception). Kết quả không được cache sau khi lời gọi kết thúc.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Trả về (kết quả, shared) với shared=True nếu kết quả lấy từ lời gọi khác.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
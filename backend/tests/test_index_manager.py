@@ -0,0 +1,19 @@
+from src.services.index_manager import IndexManager
+
+
+def test_acquire_with_version_reports_leased_index_after_swap():
+    version = ["v1"]
+    manager = IndexManager(lambda: object(), lambda: version[0], watch_interval=0)
+
+    with manager.acquire_with_version() as (retriever, leased_version):
+        version[0] = "v2"
+        assert manager.reload()
+        # Index đã hoán đổi nhưng yêu cầu đang chạy vẫn giữ index và phiên bản cũ
+        assert manager.version == "v2"
+        assert leased_version == "v1"
+        assert retriever is not None
+
+    with manager.acquire_with_version() as (new_retriever, new_version):
+        assert new_version == "v2"
+        assert new_retriever is not retriever
+    assert manager.status()["in_flight"] == 0
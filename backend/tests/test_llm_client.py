@@ -0,0 +1,182 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scripts.benchmark_ollama_lb import start_fake_ollama
+from src.services.llm_client import CircuitBreaker, HTTPTransport, LoadBalancedTransport, LLMUnavailableError
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def _start(*args, **kwargs):
+        server = start_fake_ollama(*args, **kwargs)
+        started.append(server)
+        return server
+
+    yield _start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def _url(server) -> str:
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def _balancer(servers, caps=None, failure_threshold=5, reset_timeout=30.0, probe_interval=30.0,
+              max_retries=2) -> LoadBalancedTransport:
+    backends = [
+        HTTPTransport(_url(server), probe_interval=probe_interval,
+                      breaker=CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout))
+        for server in servers
+    ]
+    transport = LoadBalancedTransport(backends, caps, max_retries=max_retries)
+    assert transport.probe()
+    return transport
+
+
+def _generate(transport, deadline: float = 10) -> str:
+    return transport.post_json("/api/generate", {"prompt": "x"}, deadline=deadline)["response"]
+
+
+def test_retries_transient_error_on_single_host(servers):
+    # Cấu hình mặc định chỉ có một host: 503 một lần vẫn phải được retry
+    server = servers(0.0, fail_times=1)
+    transport = _balancer([server])
+
+    assert _generate(transport) == f"ok từ {server.server_port}"
+    assert server.posts == 2
+
+
+def test_gives_up_after_pool_retry_budget(servers):
+    server = servers(0.0, fail=True, fail_health=False)
+    transport = _balancer([server], max_retries=2)
+
+    with pytest.raises(LLMUnavailableError):
+        _generate(transport)
+    assert server.posts == 3
+
+
+def test_fails_over_on_first_error_without_backoff(servers):
+    # Host qua được health check nhưng POST luôn lỗi
+    bad = servers(0.0, fail=True, fail_health=False)
+    good = servers(0.0)
+    transport = _balancer([bad, good], failure_threshold=3)
+
+    for i in range(10):
+        start = time.perf_counter()
+        if i % 2:
+            lines = list(transport.post_stream("/api/generate", {"prompt": "x", "stream": True}, deadline=10))
+            text = lines[0]["response"]
+        else:
+            text = _generate(transport)
+        assert text == f"ok từ {good.server_port}"
+        assert time.perf_counter() - start < 0.5
+    # Mỗi yêu cầu gọi host lỗi tối đa một lần, cho tới khi breaker mở thì host bị loại
+    assert bad.posts == 3
+    assert transport.backends[0].breaker.is_open()
+    assert transport.outstanding == [0, 0]
+
+
+def test_least_outstanding_prefers_faster_host(servers):
+    fast = servers(0.01)
+    slow = servers(0.2)
+    transport = _balancer([fast, slow])
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda _: _generate(transport), range(40)))
+
+    assert fast.posts + slow.posts == 40
+    assert fast.posts >= 3 * slow.posts
+
+
+def test_respects_per_host_cap(servers):
+    first = servers(0.05)
+    second = servers(0.05)
+    transport = _balancer([first, second], caps=[1, 2])
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: _generate(transport), range(24)))
+
+    assert first.max_active == 1
+    assert second.max_active == 2
+    assert first.posts + second.posts == 24
+
+
+def test_waiters_are_served_in_arrival_order(servers):
+    server = servers(0.05)
+    transport = _balancer([server], caps=[1])
+    finished = []
+    lock = threading.Lock()
+
+    def request(i):
+        _generate(transport)
+        with lock:
+            finished.append(i)
+
+    threads = []
+    for i in range(6):
+        thread = threading.Thread(target=request, args=(i,))
+        thread.start()
+        threads.append(thread)
+        # Đảm bảo yêu cầu i đã vào hàng đợi trước yêu cầu i + 1
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    assert finished == list(range(6))
+    assert server.max_active == 1
+
+
+def test_waiter_times_out_when_hosts_are_full(servers):
+    server = servers(0.5)
+    transport = _balancer([server], caps=[1])
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        busy = pool.submit(_generate, transport)
+        time.sleep(0.1)
+        with pytest.raises(LLMUnavailableError):
+            _generate(transport, deadline=0.2)
+        assert busy.result()
+
+
+def test_ejected_host_returns_after_breaker_reset(servers):
+    flaky = servers(0.0, fail=True, fail_health=False)
+    good = servers(0.0)
+    transport = _balancer([flaky, good], failure_threshold=1, reset_timeout=0.3, probe_interval=0.1)
+
+    _generate(transport)
+    assert transport.backends[0].breaker.is_open()
+    posts = flaky.posts
+    for _ in range(5):
+        _generate(transport)
+    assert flaky.posts == posts
+
+    # Host hồi phục: sau reset_timeout và lần probe lại, yêu cầu thử half-open đóng lại breaker
+    flaky.fail = False
+    time.sleep(0.35)
+    for _ in range(6):
+        _generate(transport)
+    assert flaky.posts > posts
+    assert transport.backends[0].breaker.state == "closed"
+
+
+def test_unhealthy_host_returns_after_reprobe(servers):
+    down = servers(0.0, fail_health=True)
+    up = servers(0.0)
+    transport = LoadBalancedTransport([HTTPTransport(_url(down), probe_interval=0.2),
+                                       HTTPTransport(_url(up), probe_interval=0.2)])
+    transport.probe()
+
+    for _ in range(4):
+        _generate(transport)
+    assert down.posts == 0
+
+    down.fail_health = False
+    time.sleep(0.25)
+    for _ in range(4):
+        _generate(transport)
+    assert down.posts > 0